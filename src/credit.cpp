@@ -71,6 +71,10 @@ void Credit::FreeAll() {
     delete _all.top();
     _all.pop();
   }
+  // free objects are among the deleted ones
+  while(!_free.empty()) {
+    _free.pop();
+  }
 }
 
 
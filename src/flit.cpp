@@ -104,4 +104,8 @@ void Flit::FreeAll() {
     delete _all.top();
     _all.pop();
   }
+  // free objects are among the deleted ones
+  while(!_free.empty()) {
+    _free.pop();
+  }
 }
@@ -35,6 +35,7 @@
  *
  */
 #include <sys/time.h>
+#include <sys/resource.h>
 
 #include <string>
 #include <cstdlib>
@@ -94,8 +95,42 @@ ostream * gWatchOut;
 
 /////////////////////////////////////////////////////////////////////////////
 
+/*Peak resident set size is taken from the kernel's high-water mark of
+ *the process, which is reset at the start of every run so batch runs
+ *report their own peak. Unlike ru_maxrss it does not include the
+ *memory of the process that started BookSim.
+ */
+void ResetPeakMemory( )
+{
+  ofstream clear_refs( "/proc/self/clear_refs" );
+  if ( clear_refs ) {
+    clear_refs << "5" << endl;
+  }
+}
+
+long PeakMemory( struct rusage const & usage )
+{
+  ifstream status( "/proc/self/status" );
+  string line;
+  while ( getline( status, line ) ) {
+    if ( line.compare( 0, 6, "VmHWM:" ) == 0 ) {
+      return atol( line.c_str( ) + 6 );
+    }
+  }
+  return usage.ru_maxrss;
+}
+
+double Seconds( struct timeval const & t )
+{
+  return (double)(t.tv_sec) + (double)(t.tv_usec)/1000000.0;
+}
+
 bool Simulate( BookSimConfig const & config )
 {
+  struct rusage start_usage, end_usage;
+  ResetPeakMemory( );
+  getrusage( RUSAGE_SELF, &start_usage );
+
   vector<Network *> net;
 
   int subnets = config.GetInt("subnets");
@@ -147,10 +182,65 @@ bool Simulate( BookSimConfig const & config )
   delete trafficManager;
   trafficManager = NULL;
 
+  getrusage( RUSAGE_SELF, &end_usage );
+  cout << "Resource usage: user "
+       << Seconds( end_usage.ru_utime ) - Seconds( start_usage.ru_utime )
+       << " s, system "
+       << Seconds( end_usage.ru_stime ) - Seconds( start_usage.ru_stime )
+       << " s, peak RSS " << PeakMemory( end_usage ) << " kB" << endl;
+
   return result;
 }
 
 
+void InitializeGlobals( BookSimConfig const & config )
+{
+  /*initialize routing, traffic, injection functions
+   */
+  InitializeRoutingMap( config );
+
+  gPrintActivity = (config.GetInt("print_activity") > 0);
+  gTrace = (config.GetInt("viewer_trace") > 0);
+}
+
+/*Batch mode: every line of standard input holds param=value overrides
+ *applied on top of the configuration given on the command line, and
+ *is simulated in turn without restarting the process. Output of each
+ *run is enclosed in "BATCH BEGIN <job>" and "BATCH END <job> <status>"
+ *lines, status is 1 when the run completed and 0 when it was stopped
+ *as unstable. Every run
+ *starts from the random state of a fresh process, so results do not
+ *depend on the order of jobs.
+ */
+int RunBatch( BookSimConfig const & base )
+{
+  vector<long> save_x;
+  vector<double> save_u;
+  SaveRandomState( save_x, save_u );
+
+  string line;
+  for ( int job = 0; getline( cin, line ); ++job ) {
+    cout << "BATCH BEGIN " << job << endl;
+
+    // the last constructed config receives parsed parameters
+    BookSimConfig config;
+    config = base;
+    istringstream overrides( line );
+    string arg;
+    while ( overrides >> arg ) {
+      cout << "OVERRIDE Parameter: " << arg << endl;
+      config.ParseString( arg );
+    }
+
+    RestoreRandomState( save_x, save_u );
+    InitializeGlobals( config );
+    bool result = Simulate( config );
+    cout << "BATCH END " << job << " " << (result ? 1 : 0) << endl;
+  }
+  return 0;
+}
+
+
 int main( int argc, char **argv )
 {
 
@@ -158,17 +248,18 @@ int main( int argc, char **argv )
 
 
   if ( !ParseArgs( &config, argc, argv ) ) {
-    cerr << "Usage: " << argv[0] << " configfile... [param=value...]" << endl;
+    cerr << "Usage: " << argv[0] << " configfile... [param=value...] [--batch]" << endl;
     return 0;
  } 
 
-  
-  /*initialize routing, traffic, injection functions
-   */
-  InitializeRoutingMap( config );
+  bool batch = false;
+  for ( int i = 1; i < argc; ++i ) {
+    if ( string( argv[i] ) == "--batch" ) {
+      batch = true;
+    }
+  }
 
-  gPrintActivity = (config.GetInt("print_activity") > 0);
-  gTrace = (config.GetInt("viewer_trace") > 0);
+  InitializeGlobals( config );
   
   string watch_out_file = config.GetStr( "watch_out" );
   if(watch_out_file == "") {
@@ -180,6 +271,10 @@ int main( int argc, char **argv )
   }
   
 
+  if ( batch ) {
+    return RunBatch( config );
+  }
+
   /*configure and run the simulator
    */
   bool result = Simulate( config );
@@ -54,4 +54,8 @@ void PacketReplyInfo::FreeAll()
     delete _all.top();
     _all.pop();
   }
+  // free objects are among the deleted ones
+  while(!_free.empty()) {
+    _free.pop();
+  }
 }
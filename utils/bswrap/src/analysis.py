@@ -0,0 +1,217 @@
+import sys
+import csv
+import argparse
+from pathlib import Path
+from dataclasses import dataclass
+import numpy as np
+from model import ColumnarResults
+from configs import get_topology_size
+
+
+# Columns identifying one curve of a sweep, everything except
+# the injection rate.
+CURVE_COLUMNS = [
+    "topo_name",
+    "topo_num_nodes",
+    "topo_links",
+    "cfg_routing_func",
+    "cfg_traffic_type",
+    "cfg_sim_count",
+    "cfg_sample_period",
+    "cfg_seed",
+]
+
+
+@dataclass
+class Curves:
+    """
+    Rows grouped into curves and sorted by injection rate.
+    Points of curve i are rates[offsets[i]:offsets[i + 1]].
+    rows maps the points back to row indices of the table.
+    """
+    keys: list[dict]
+    offsets: np.ndarray
+    rows: np.ndarray
+    rates: np.ndarray
+    values: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def curve(self, i: int) -> tuple[np.ndarray, np.ndarray]:
+        points = slice(self.offsets[i], self.offsets[i + 1])
+        return self.rates[points], self.values[points]
+
+
+def _decode_keys(table: ColumnarResults, columns: list[str],
+                 rows: np.ndarray) -> list[dict]:
+    decoded = {}
+    for name in columns:
+        values = np.asarray(table[name][rows])
+        decoded[name] = (table.decode(name, values)
+                         if table.is_categorical(name) else values.tolist())
+    return [dict(zip(columns, key)) for key in zip(*decoded.values())]
+
+
+def group_rows(table: ColumnarResults, columns: list[str],
+               rows: np.ndarray | None = None
+               ) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Returns indices of the rows (all by default) and id of the group
+    (unique combination of column values) of every one of them.
+    """
+    if rows is None:
+        rows = np.arange(len(table))
+    if len(rows) == 0:
+        return rows, np.zeros(0, dtype=np.int64)
+    # Mixed radix number of per-column value indices, renumbered
+    # after every column to stay within int64.
+    group_ids = np.zeros(len(rows), dtype=np.int64)
+    for name in columns:
+        uniques, inverse = np.unique(table[name][rows], return_inverse=True)
+        group_ids = group_ids * len(uniques) + inverse.reshape(-1)
+        _, group_ids = np.unique(group_ids, return_inverse=True)
+    return rows, group_ids.reshape(-1)
+
+
+def latency_curves(table: ColumnarResults,
+                   metric: str = "packet_latency_avg",
+                   mask: np.ndarray | None = None) -> Curves:
+    """
+    Metric versus injection rate for every config of the table.
+    """
+    # Results of older versions lack some of the columns.
+    columns = [name for name in CURVE_COLUMNS if name in table.columns]
+    rows, group_ids = group_rows(
+        table, columns, None if mask is None else np.flatnonzero(mask))
+    rates = np.asarray(table["cfg_injection_rate"][rows])
+    order = np.lexsort((rates, group_ids))
+    rows, group_ids, rates = rows[order], group_ids[order], rates[order]
+    starts = np.flatnonzero(np.diff(group_ids, prepend=-1))
+    return Curves(
+        keys=_decode_keys(table, columns, rows[starts]),
+        offsets=np.append(starts, len(rows)),
+        rows=rows,
+        rates=rates,
+        values=np.asarray(table[metric][rows]),
+    )
+
+
+def saturation_points(curves: Curves, latency_factor: float = 3.0
+                      ) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Returns zero-load latency (at the lowest simulated injection rate)
+    and saturation rate of every curve. Saturation rate is the highest
+    rate whose latency stays within latency_factor times the zero-load
+    latency. Unstable simulations have no results, so the highest rate
+    with a result is the limit when the threshold is never crossed.
+    """
+    starts = curves.offsets[:-1]
+    zero_load = curves.values[starts]
+    lengths = np.diff(curves.offsets)
+    threshold = np.repeat(zero_load * latency_factor, lengths)
+    below = np.where(curves.values <= threshold, curves.rates, -np.inf)
+    return zero_load, np.maximum.reduceat(below, starts)
+
+
+def pareto_front(objectives: np.ndarray) -> np.ndarray:
+    """
+    Returns indices of non-dominated rows of the (n, m) objective
+    matrix, every objective is minimized. Of equal rows only the
+    first one is kept.
+    """
+    candidates = np.arange(len(objectives))
+    points = objectives
+    i = 0
+    while i < len(points):
+        keep = np.any(points < points[i], axis=1)
+        keep[i] = True
+        candidates, points = candidates[keep], points[keep]
+        i = np.count_nonzero(keep[:i]) + 1
+    return candidates
+
+
+def link_counts(table: ColumnarResults,
+                rows: np.ndarray | None = None) -> np.ndarray:
+    """
+    Number of router-to-router links of the topology of every row.
+    Computed once per distinct topology.
+    """
+    columns = ["topo_name", "topo_num_nodes", "topo_links"]
+    rows, group_ids = group_rows(table, columns, rows)
+    if len(rows) == 0:
+        return np.zeros(0, dtype=np.int64)
+    firsts = np.zeros(group_ids.max() + 1, dtype=np.int64)
+    firsts[group_ids[::-1]] = rows[::-1]
+    counts = np.array([
+        get_topology_size(key["topo_name"], key["topo_num_nodes"],
+                          key["topo_links"])[1]
+        for key in _decode_keys(table, columns, firsts)
+    ])
+    return counts[group_ids]
+
+
+def topology_pareto(table: ColumnarResults, injection_rate: float,
+                    metrics: tuple[str, ...] = (
+                        "packet_latency_avg", "hops_avg")) -> np.ndarray:
+    """
+    Returns row indices of the Pareto front of metrics and link
+    count among results at the injection rate.
+    """
+    mask = np.isclose(table["cfg_injection_rate"], injection_rate)
+    rows = np.flatnonzero(mask)
+    objectives = np.column_stack(
+        [np.asarray(table[name][rows]) for name in metrics]
+        + [link_counts(table, rows)])
+    return rows[pareto_front(objectives)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog="bswrap-analysis",
+        description="Analysis of sweep results exported with "
+        "--export-columnar. Prints CSV to stdout.",
+    )
+    parser.add_argument("results", type=Path,
+                        help="Directory with columnar results.")
+    parser.add_argument("query", choices=["curves", "saturation", "pareto"])
+    parser.add_argument("--metric", default="packet_latency_avg",
+                        help="Metric of the curves. "
+                        "[Default: 'packet_latency_avg']")
+    parser.add_argument("--latency-factor", type=float, default=3.0,
+                        help="Saturation latency relative to zero-load "
+                        "latency. [Default: 3.0]")
+    parser.add_argument("-i", "--injection-rate", type=float, default=None,
+                        help="Injection rate of Pareto front results.")
+    args = parser.parse_args()
+    if args.query == "pareto" and args.injection_rate is None:
+        parser.error("pareto requires --injection-rate")
+
+    table = ColumnarResults(args.results)
+    columns = [name for name in CURVE_COLUMNS if name in table.columns]
+    writer = csv.writer(sys.stdout)
+    if args.query == "pareto":
+        rows = topology_pareto(table, args.injection_rate)
+        metrics = ["packet_latency_avg", "hops_avg"]
+        writer.writerow(columns + metrics + ["links_count"])
+        counts = link_counts(table, rows)
+        for key, row, count in zip(_decode_keys(table, columns, rows),
+                                   rows, counts):
+            writer.writerow(list(key.values())
+                            + [table[name][row] for name in metrics]
+                            + [count])
+    else:
+        curves = latency_curves(table, args.metric)
+        if args.query == "curves":
+            writer.writerow(columns + ["cfg_injection_rate",
+                                             args.metric])
+            for i, key in enumerate(curves.keys):
+                for rate, value in zip(*curves.curve(i)):
+                    writer.writerow(list(key.values()) + [rate, value])
+        else:
+            zero_load, saturation = saturation_points(
+                curves, args.latency_factor)
+            writer.writerow(columns + ["zero_load_latency",
+                                             "saturation_rate"])
+            for key, lat, rate in zip(curves.keys, zero_load, saturation):
+                writer.writerow(list(key.values()) + [lat, rate])
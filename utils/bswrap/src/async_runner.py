@@ -0,0 +1,242 @@
+import os
+import time
+import signal
+import asyncio
+from pathlib import Path
+from threading import Lock
+from collections import Counter
+from collections.abc import Iterator
+from loguru import logger
+from tqdm import tqdm
+from model import Config, Result, IResultRepo
+from simulator import (
+    SimRunner,
+    BadSimSummary,
+    SimSummaryNotFound,
+    SimAborted,
+    SimTimeout,
+)
+from sim_output import AbortRule, SimOutputParser
+from runner import (
+    MultiSimRunner,
+    SimulationTask,
+    ProgressBarSync,
+    TopologyDedup,
+)
+from cache import ResultCache
+from scheduler import CostModel, MemoryBudget
+from journal import SimJournal
+from topology_filter import TopologyFilter
+from surrogate import SurrogateFilter
+from usage import UsageReport
+from metrics import SweepMetrics, TimedRepo
+
+
+class AsyncSimRunner(SimRunner):
+    """
+    Simulator runner built on asyncio subprocesses.
+    BookSim is started without shell in its own process group,
+    the whole group is killed on timeout or cancellation.
+    """
+    def __init__(self, booksim_exec: Path, cache: ResultCache | None = None,
+                 abort_rules: list[AbortRule] | None = None,
+                 cost_model: CostModel | None = None,
+                 timeout: float | None = None,
+                 details: bool = False,
+                 memory: MemoryBudget | None = None):
+        super().__init__(booksim_exec, cache, abort_rules, cost_model,
+                         details, memory)
+        self._timeout = timeout
+
+    @staticmethod
+    def _kill(proc: asyncio.subprocess.Process) -> None:
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    @staticmethod
+    async def _consume(stream: asyncio.StreamReader,
+                       parser: SimOutputParser) -> None:
+        while line := await stream.readline():
+            parser.feed_timed(line.decode())
+
+    def _prepare(self, config: Config, configs_dir: Path
+                 ) -> tuple[str | None, Result | None, list[str], float]:
+        """
+        Returns cache key, cached result and, on a miss, simulator
+        arguments with the time taken to create them. Fingerprinting
+        and config generation hash and write whole topologies, so
+        this runs off the event loop.
+        """
+        sim_config = self._get_simulator_config(config)
+        cache_key, res = self._lookup_cache(sim_config)
+        if res is not None:
+            return cache_key, res, [], 0.0
+        start = time.perf_counter()
+        args = self._create_args(sim_config, configs_dir)
+        return cache_key, None, args, time.perf_counter() - start
+
+    async def sim_async(self, config: Config, configs_dir: Path) -> Result:
+        cache_key, res, args, config_time = await asyncio.to_thread(
+            self._prepare, config, configs_dir)
+        if res is not None:
+            return self._attach_config(res, config)
+
+        parser = self._new_parser()
+        reserved = None
+        if self._memory is not None:
+            reserved = await asyncio.to_thread(self._memory.acquire, config)
+        try:
+            start = time.monotonic()
+            await self._run_async(args, parser)
+        finally:
+            if reserved is not None:
+                self._memory.release(reserved)
+
+        return self._finish(config, parser, cache_key,
+                            time.monotonic() - start, config_time)
+
+    async def _run_async(self, args: list[str],
+                         parser: SimOutputParser) -> None:
+        proc = await asyncio.create_subprocess_exec(
+            *self._get_command(args),
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+            start_new_session=True,
+        )
+        self._limit(proc.pid)
+        try:
+            await asyncio.wait_for(
+                self._consume(proc.stdout, parser), self._timeout)
+        except asyncio.TimeoutError:
+            raise SimTimeout() from None
+        finally:
+            if proc.returncode is None:
+                self._kill(proc)
+            await proc.wait()
+
+
+class AsyncMultiSimRunner(MultiSimRunner):
+    """
+    Runs simulations from a single thread, `jobs` of them at a time.
+    """
+    @staticmethod
+    async def _async_worker(configs: Iterator[Config],
+                            simulator: AsyncSimRunner, cfgs_dir: Path,
+                            bar: tqdm, repo: IResultRepo,
+                            journal: SimJournal | None,
+                            dedup: TopologyDedup | None,
+                            outcomes: Counter,
+                            usage: UsageReport,
+                            metrics: SweepMetrics | None) -> None:
+        for cfg in configs:
+            bar.set_description(
+                f"Processing '{cfg.topo.name}_N{cfg.topo.num_nodes}_"
+                f"R{cfg.routing_function}'"
+            )
+            status = SimJournal.FAILED
+            res = None
+            if metrics is not None:
+                metrics.started()
+            start = time.monotonic()
+            try:
+                res = await simulator.sim_async(cfg, cfgs_dir)
+                status = SimJournal.DONE
+            except SimTimeout:
+                logger.warning(f"Timeout on config {cfg}")
+                status = SimJournal.TIMEOUT
+            except SimAborted as e:
+                logger.info(f"Aborted config {cfg}: {e}")
+                status = SimJournal.ABORTED
+            except (BadSimSummary, SimSummaryNotFound):
+                logger.warning(f"Error occured on config {cfg}")
+            except ValueError:
+                logger.warning(f"Error on circulant config: {cfg.topo}")
+
+            outcomes[status] += 1
+            if metrics is not None:
+                metrics.finished(status, time.monotonic() - start)
+            MultiSimRunner._record(
+                cfg, status, res, repo, journal, dedup, usage)
+            bar.update()
+
+    @staticmethod
+    async def _run(simulator_path: Path, tasks: list[SimulationTask],
+                   configs_dir: Path, repo: IResultRepo, jobs: int,
+                   cache: ResultCache | None, journal: SimJournal | None,
+                   abort_rules: list[AbortRule] | None,
+                   cost_model: CostModel | None,
+                   timeout: float | None,
+                   dedup_isomorphic: bool,
+                   topo_filter: TopologyFilter | None,
+                   details: bool,
+                   metrics: SweepMetrics | None,
+                   memory: MemoryBudget | None,
+                   surrogate: SurrogateFilter | None) -> None:
+        total = sum(map(len, tasks))
+        if metrics is not None:
+            metrics.set_total(total)
+            repo = TimedRepo(repo, metrics)
+        bar = tqdm(total=total)
+        dedup = TopologyDedup(repo, journal) if dedup_isomorphic else None
+        configs = MultiSimRunner._prepare_configs(
+            tasks, jobs, journal, cost_model,
+            ProgressBarSync(bar, Lock(), metrics), dedup, topo_filter,
+            surrogate)
+
+        logger.info("Starting simulations.")
+        simulator = AsyncSimRunner(simulator_path, cache, abort_rules,
+                                   cost_model, timeout, details, memory)
+        outcomes: Counter = Counter()
+        usage = UsageReport()
+        try:
+            # Workers share one lazy generator, so no more than `jobs`
+            # configs are taken from it at a time.
+            await asyncio.gather(*(
+                AsyncMultiSimRunner._async_worker(
+                    configs, simulator, configs_dir,
+                    bar, repo, journal, dedup, outcomes, usage, metrics)
+                for _ in range(jobs)
+            ))
+        finally:
+            bar.close()
+
+        logger.info(f"Done: {outcomes[SimJournal.DONE]} succeeded, "
+                    f"{outcomes[SimJournal.FAILED]} failed, "
+                    f"{outcomes[SimJournal.ABORTED]} aborted, "
+                    f"{outcomes[SimJournal.TIMEOUT]} timed out.")
+        usage.log()
+
+    @staticmethod
+    def run(simulator_path: Path, tasks: list[SimulationTask],
+            configs_dir: Path, repo: IResultRepo, jobs: int,
+            cache: ResultCache | None = None,
+            journal: SimJournal | None = None,
+            abort_rules: list[AbortRule] | None = None,
+            cost_model: CostModel | None = None,
+            timeout: float | None = None,
+            dedup_isomorphic: bool = False,
+            topo_filter: TopologyFilter | None = None,
+            details: bool = False,
+            metrics: SweepMetrics | None = None,
+            memory: MemoryBudget | None = None,
+            surrogate: SurrogateFilter | None = None):
+        """
+        Runs simulations for all configs of the tasks.
+        Simulations running longer than `timeout` seconds are killed
+        and reported as timed out. Progress is reported to the metrics.
+        With the memory budget, simulations start only while their
+        estimated memory fits into it. With the surrogate, only configs
+        it is unsure about or predicts competitive are simulated.
+        """
+        try:
+            asyncio.run(AsyncMultiSimRunner._run(
+                simulator_path, tasks, configs_dir, repo, jobs,
+                cache, journal, abort_rules, cost_model, timeout,
+                dedup_isomorphic, topo_filter, details, metrics, memory,
+                surrogate))
+        except KeyboardInterrupt:
+            logger.error("Interrupted, finished simulations are saved. "
+                         "Run with --resume to continue.")
+            raise
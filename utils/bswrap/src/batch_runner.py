@@ -0,0 +1,99 @@
+import subprocess as sp
+from threading import Lock
+from simulator import SimRunner
+from sim_output import SimOutputParser
+
+
+class BatchProcess:
+    """
+    BookSim process started with --batch. Simulations sharing the base
+    config are written to its stdin as lines of overrides and run one
+    after another. Not thread-safe.
+    """
+    _BEGIN = "BATCH BEGIN"
+    _END = "BATCH END"
+
+    def __init__(self, command: list[str], base_config: str):
+        self.base_config = base_config
+        self._proc = sp.Popen(
+            command,
+            stdin=sp.PIPE,
+            stdout=sp.PIPE,
+            stderr=sp.STDOUT,
+            text=True,
+        )
+
+    @property
+    def pid(self) -> int:
+        return self._proc.pid
+
+    def alive(self) -> bool:
+        return self._proc.poll() is None
+
+    def run(self, overrides: list[str], parser: SimOutputParser) -> None:
+        """
+        Runs one simulation, feeding its output to the parser. The
+        process is killed when the simulation does not end cleanly,
+        e.g. on abort or bad summary, and exits by itself on BookSim
+        errors. Either way the parser tells what happened.
+        """
+        try:
+            self._proc.stdin.write(" ".join(overrides) + "\n")
+            self._proc.stdin.flush()
+            for line in self._proc.stdout:
+                if line.startswith(self._END):
+                    return
+                if not line.startswith(self._BEGIN):
+                    parser.feed_timed(line)
+        except BrokenPipeError:
+            pass
+        except BaseException:
+            self.close()
+            raise
+        self.close()
+
+    def close(self) -> None:
+        if self._proc.poll() is None:
+            self._proc.kill()
+        self._proc.communicate()
+
+
+class BatchSimRunner(SimRunner):
+    """
+    Simulator runner reusing long-lived BookSim processes in batch mode,
+    so short simulations do not pay for process startup and parsing of
+    the base config. Every concurrent simulation takes an idle process
+    or starts a new one, and gives it back when done.
+    Thread-safe.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._idle: list[BatchProcess] = []
+        self._mx = Lock()
+
+    def _acquire(self, base_config: str) -> BatchProcess:
+        with self._mx:
+            for i, proc in enumerate(self._idle):
+                if proc.base_config == base_config:
+                    del self._idle[i]
+                    if proc.alive():
+                        return proc
+                    proc.close()
+                    break
+        proc = BatchProcess(
+            self._get_command([base_config, "--batch"]), base_config)
+        self._limit(proc.pid)
+        return proc
+
+    def _run_simulator(self, args: list[str], parser: SimOutputParser) -> None:
+        proc = self._acquire(args[0])
+        proc.run(args[1:], parser)
+        if proc.alive():
+            with self._mx:
+                self._idle.append(proc)
+
+    def close(self) -> None:
+        with self._mx:
+            idle, self._idle = self._idle, []
+        for proc in idle:
+            proc.close()
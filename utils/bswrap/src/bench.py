@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+import gc
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess as sp
+from pathlib import Path
+from dataclasses import dataclass, asdict
+import numpy as np
+from loguru import logger
+from model import Config, Topology, Result, CSVResultRepo, SQLiteResultRepo
+from sim_output import SimOutputParser
+from runner import MultiSimRunner, SimulationTask
+from async_runner import AsyncMultiSimRunner
+import fake_booksim
+
+FAKE_BOOKSIM = Path(__file__).with_name("fake_booksim.py")
+
+
+@dataclass
+class Measurement:
+    """
+    One benchmark row. Rate is per second of the measured unit, jobs,
+    lines or results. Overhead is wall time spent per job beyond the
+    simulated latency, in milliseconds. Memory growth is the change of
+    resident set size of this process over the benchmark, in MiB.
+    """
+    name: str
+    count: int
+    seconds: float
+    rate: float
+    overhead_ms: float | None = None
+    memory_growth_mib: float | None = None
+
+
+def _rss_mib() -> float:
+    gc.collect()
+    with open("/proc/self/status") as file:
+        for line in file:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def _tasks(configs: int) -> list[SimulationTask]:
+    """
+    Task of `configs` distinct configs of one small circulant, so
+    topology generation is paid once as in real sweeps.
+    """
+    rates = np.linspace(0.001, 0.6, configs).round(6).tolist()
+    return [SimulationTask(["circulant"], [16], ["1,3"], ["min"],
+                           ["uniform"], [1], rates)]
+
+
+def _new_repo(kind: str, directory: Path):
+    if kind == "sqlite":
+        return SQLiteResultRepo(directory / "bench.db")
+    return CSVResultRepo(directory / "bench.csv")
+
+
+def bench_spawn(count: int) -> Measurement:
+    """
+    Sequential runs of the fake without bswrap, the cost of starting
+    the simulator process that every single-run engine pays.
+    """
+    args = [sys.executable, str(FAKE_BOOKSIM), "base", "injection_rate=0.1"]
+    env = os.environ | {fake_booksim.LATENCY_ENV: "0",
+                        fake_booksim.FAILURE_ENV: "0",
+                        fake_booksim.HANG_ENV: "0"}
+    start = time.perf_counter()
+    for _ in range(count):
+        sp.run(args, stdout=sp.DEVNULL, env=env)
+    seconds = time.perf_counter() - start
+    return Measurement("fake spawn", count, seconds, count / seconds,
+                       seconds / count * 1000)
+
+
+def bench_parser(runs: int, periods: int, filler: int,
+                 drain: int) -> Measurement:
+    lines = list(fake_booksim.render(0.1, 1, periods, filler, drain=drain))
+    start = time.perf_counter()
+    for _ in range(runs):
+        parser = SimOutputParser()
+        for line in lines:
+            parser.feed(line)
+        parser.result()
+    seconds = time.perf_counter() - start
+    return Measurement("parser", runs * len(lines), seconds,
+                       runs * len(lines) / seconds)
+
+
+def bench_repo(kind: str, count: int, directory: Path) -> Measurement:
+    config = Config("min", "uniform", 1, Topology("circulant", 16, "1,3"))
+    parser = SimOutputParser()
+    for line in fake_booksim.render(0.1):
+        parser.feed(line)
+    template = parser.result()
+    template.config = config
+    rss = _rss_mib()
+    repo = _new_repo(kind, directory)
+    start = time.perf_counter()
+    for _ in range(count):
+        repo.save(Result(**{**template.__dict__}))
+    repo.close()
+    seconds = time.perf_counter() - start
+    return Measurement(f"repo {kind}", count, seconds, count / seconds,
+                       memory_growth_mib=_rss_mib() - rss)
+
+
+def bench_runner(engine: str, repo_kind: str, configs: int, jobs: int,
+                 latency: float, timeout: float | None,
+                 directory: Path) -> Measurement:
+    """
+    Full sweep of `configs` configs through the engine against the
+    fake simulator. Only the async engine has the timeout.
+    """
+    configs_dir = directory / "configs"
+    configs_dir.mkdir()
+    repo = _new_repo(repo_kind, directory)
+    rss = _rss_mib()
+    start = time.perf_counter()
+    if engine == "async":
+        AsyncMultiSimRunner.run(FAKE_BOOKSIM, _tasks(configs), configs_dir,
+                                repo, jobs, timeout=timeout)
+    else:
+        MultiSimRunner.run(FAKE_BOOKSIM, _tasks(configs), configs_dir,
+                           repo, jobs, persistent_workers=engine == "batch")
+    repo.close()
+    seconds = time.perf_counter() - start
+    overhead = (seconds * jobs / configs - latency) * 1000
+    return Measurement(f"{engine} + {repo_kind}", configs, seconds,
+                       configs / seconds, overhead, _rss_mib() - rss)
+
+
+def _print_table(rows: list[Measurement]) -> None:
+    print(f"{'benchmark':<20} {'count':>8} {'seconds':>9} {'rate/s':>11} "
+          f"{'overhead ms':>12} {'RSS MiB':>8}")
+    for row in rows:
+        overhead = "" if row.overhead_ms is None else f"{row.overhead_ms:.2f}"
+        memory = ("" if row.memory_growth_mib is None
+                  else f"{row.memory_growth_mib:+.1f}")
+        print(f"{row.name:<20} {row.count:>8} {row.seconds:>9.2f} "
+              f"{row.rate:>11.1f} {overhead:>12} {memory:>8}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog="bswrap-bench",
+        description="Measures overhead of bswrap itself: engines and "
+        "result repositories run sweeps against a fake BookSim, parser "
+        "and repositories are also measured alone.",
+    )
+    parser.add_argument("-n", "--configs", type=int, default=2000,
+                        help="Configs of every sweep. [Default: 2000]")
+    parser.add_argument("-j", "--jobs", type=int, default=4,
+                        help="Jobs of every sweep. [Default: 4]")
+    parser.add_argument("--engines", default="thread,async,batch",
+                        help="Comma-separated engines to measure: "
+                        "'thread', 'async' and 'batch' (thread engine "
+                        "with persistent workers). "
+                        "[Default: 'thread,async,batch']")
+    parser.add_argument("--repos", default="csv,sqlite",
+                        help="Comma-separated result repositories: "
+                        "'csv' and 'sqlite'. [Default: 'csv,sqlite']")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="Seconds every fake simulation sleeps. "
+                        "[Default: 0]")
+    parser.add_argument("--periods", type=int, default=3,
+                        help="Sample periods printed by every fake "
+                        "simulation. [Default: 3]")
+    parser.add_argument("--filler", type=int, default=0,
+                        help="Extra lines of network listing printed by "
+                        "every fake simulation. [Default: 0]")
+    parser.add_argument("--drain", type=int, default=1,
+                        help="Listings of in-flight flits printed while "
+                        "the network drains by every fake simulation, "
+                        "as in runs close to saturation. [Default: 1]")
+    parser.add_argument("--failure", type=float, default=0.0,
+                        help="Probability of a fake simulation failing. "
+                        "[Default: 0]")
+    parser.add_argument("--hang", type=float, default=0.0,
+                        help="Probability of a fake simulation hanging "
+                        "for --hang-time seconds before it runs. "
+                        "[Default: 0]")
+    parser.add_argument("--hang-time", type=float, default=3600.0,
+                        help="[Default: 3600]")
+    parser.add_argument("-t", "--timeout", type=float, default=None,
+                        help="Timeout of simulations in seconds, async "
+                        "engine only. Other engines wait for hanging "
+                        "simulations.")
+    parser.add_argument("--json", type=Path, default=None,
+                        help="Also write the measurements to this file, "
+                        "one JSON object per line.")
+    args = parser.parse_args()
+
+    engines = args.engines.split(",")
+    repos = args.repos.split(",")
+    for name in engines:
+        if name not in ("thread", "async", "batch"):
+            parser.error(f"unknown engine '{name}'")
+    for name in repos:
+        if name not in ("csv", "sqlite"):
+            parser.error(f"unknown repository '{name}'")
+
+    os.environ[fake_booksim.LATENCY_ENV] = str(args.latency)
+    os.environ[fake_booksim.PERIODS_ENV] = str(args.periods)
+    os.environ[fake_booksim.FILLER_ENV] = str(args.filler)
+    os.environ[fake_booksim.DRAIN_ENV] = str(args.drain)
+    os.environ[fake_booksim.FAILURE_ENV] = str(args.failure)
+    os.environ[fake_booksim.HANG_ENV] = str(args.hang)
+    os.environ[fake_booksim.HANG_TIME_ENV] = str(args.hang_time)
+
+    logger.remove()
+    logger.add(sys.stderr, level="ERROR")
+
+    rows = [
+        bench_spawn(min(args.configs, 100)),
+        bench_parser(min(args.configs, 1000), args.periods, args.filler,
+                     args.drain),
+    ]
+    for repo_kind in repos:
+        with tempfile.TemporaryDirectory() as directory:
+            rows.append(bench_repo(repo_kind, args.configs * 10,
+                                   Path(directory)))
+    for engine in engines:
+        for repo_kind in repos:
+            with tempfile.TemporaryDirectory() as directory:
+                rows.append(bench_runner(engine, repo_kind, args.configs,
+                                         args.jobs, args.latency,
+                                         args.timeout, Path(directory)))
+
+    _print_table(rows)
+    if args.json is not None:
+        with open(args.json, "a") as file:
+            for row in rows:
+                file.write(json.dumps(asdict(row)) + "\n")
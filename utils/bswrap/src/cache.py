@@ -0,0 +1,81 @@
+import os
+import json
+import base64
+import zipfile
+import hashlib
+import threading
+from pathlib import Path
+from dataclasses import fields
+from loguru import logger
+from model import Result, SimDetails, USAGE_FIELDS
+from configs import ISimConfig
+
+
+class ResultCache:
+    """
+    Persistent content-addressed storage of simulation results.
+    Key is a hash of the simulator executable and the config
+    fingerprint, so rebuilding BookSim or changing any config
+    parameter or topology invalidates the entry.
+    Entries are written atomically, safe for concurrent use.
+    """
+    _CHUNK_SIZE = 1 << 20
+
+    def __init__(self, cache_dir: Path, booksim_exec: Path):
+        self._dir = cache_dir
+        self._dir.mkdir(parents=True, exist_ok=True)
+        self._exec_digest = self._hash_file(booksim_exec)
+
+    @classmethod
+    def _hash_file(cls, path: Path) -> str:
+        h = hashlib.sha256()
+        with open(path, "rb") as file:
+            while chunk := file.read(cls._CHUNK_SIZE):
+                h.update(chunk)
+        return h.hexdigest()
+
+    def _entry_path(self, key: str) -> Path:
+        return self._dir.joinpath(key[:2], key + ".json")
+
+    def key(self, sim_config: ISimConfig) -> str:
+        h = hashlib.sha256(self._exec_digest.encode())
+        h.update(sim_config.get_fingerprint().encode())
+        return h.hexdigest()
+
+    def get(self, key: str) -> Result | None:
+        """
+        Returns cached result or None on miss.
+        Returned result has no config attached.
+        """
+        try:
+            with open(self._entry_path(key)) as file:
+                data = json.load(file)
+            res = Result.from_dict(data)
+            if data.get("details") is not None:
+                res.details = SimDetails.from_bytes(
+                    base64.b64decode(data["details"]))
+            return res
+        except FileNotFoundError:
+            return None
+        except (ValueError, TypeError, zipfile.BadZipFile):
+            logger.warning(f"Corrupted cache entry {key}, ignoring it")
+            return None
+
+    def put(self, key: str, res: Result) -> None:
+        path = self._entry_path(key)
+        path.parent.mkdir(exist_ok=True)
+        # Resource usage belongs to the run, a cache hit costs nothing.
+        data = {
+            f.name: getattr(res, f.name)
+            for f in fields(Result)
+            if f.name not in ("config", "details")
+            and f.name not in USAGE_FIELDS
+        }
+        if res.details is not None:
+            data["details"] = base64.b64encode(
+                res.details.to_bytes()).decode()
+        tmp_path = path.with_suffix(
+            f".{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_path, "w") as file:
+            json.dump(data, file)
+        os.replace(tmp_path, path)
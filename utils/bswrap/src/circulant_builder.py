@@ -1,31 +1,25 @@
 #!/usr/bin/env python3
+import sys
 import argparse
+from collections.abc import Iterator
+from typing import TextIO
+from dataclasses import dataclass
+import numpy as np
 
 
-class CirculantNode:
-    def __init__(self, id: int):
-        self.id = id
-        self.links = []
-
-    def get_links_ids(self) -> list[int]:
-        res = []
-        for link in self.links:
-            res.append(link.id)
-        return res
+@dataclass
+class GraphMetrics:
+    """
+    Distance metrics of a graph, infinite when it is disconnected.
+    """
+    connected: bool
+    diameter: float
+    avg_distance: float
 
 
 class Circulant:
-    @staticmethod
-    def _build_circulant(num_nodes: int, links: list[int]) -> list[CirculantNode]:
-        res: list[CirculantNode] = []
-        for i in range(num_nodes):
-            res.append(CirculantNode(i))
-        for i in range(num_nodes):
-            for link in links:
-                link_idx = (i + link) % num_nodes
-                res[i].links.append(res[link_idx])
-                res[link_idx].links.append(res[i])
-        return res
+    # Rows formatted at once by iter_booksim, bounds memory use.
+    CHUNK_SIZE = 1 << 16
 
     def __init__(self, num_nodes: int, links: list[int]):
         if num_nodes < 3:
@@ -39,18 +33,77 @@ class Circulant:
                     f"1 <= link <= {max_link_index}, actual {link}"
                 )
 
-        self._nodes: list[CirculantNode] = self._build_circulant(
-            num_nodes, sorted(list(set(links))))
+        self.num_nodes = num_nodes
+        self.links = np.array(sorted(set(links)), dtype=np.int64)
+
+    def neighbors(self, start: int = 0, stop: int | None = None) -> np.ndarray:
+        """
+        Returns (stop - start) x 2k matrix of neighbors of nodes
+        start..stop-1, k is the number of distinct links. Neighbors of
+        a node are ordered as the anynet file lists them.
+        """
+        if stop is None:
+            stop = self.num_nodes
+        n, k = self.num_nodes, len(self.links)
+        ids = np.arange(start, stop, dtype=np.int64)[:, None]
+        forward = (ids + self.links) % n
+        backward = (ids - self.links) % n
+        # Order of the original builder: edge (i, i + link) was appended
+        # to both ends while iterating over i and then over links.
+        link_idx = np.arange(k, dtype=np.int64)
+        order_keys = np.concatenate([
+            np.broadcast_to(ids * k + link_idx, forward.shape),
+            backward * k + link_idx,
+        ], axis=1)
+        res = np.concatenate([forward, backward], axis=1)
+        order = np.argsort(order_keys, axis=1)
+        return np.take_along_axis(res, order, axis=1)
+
+    def distance_metrics(self) -> GraphMetrics:
+        """
+        Circulants are vertex-transitive, distances from node 0 give
+        the metrics of the whole graph. Computed by one BFS with the
+        frontier expanded as an array.
+        """
+        n = self.num_nodes
+        steps = np.concatenate([self.links, -self.links])
+        dist = np.full(n, -1, dtype=np.int64)
+        dist[0] = 0
+        frontier = np.zeros(1, dtype=np.int64)
+        level = 0
+        total = 0
+        reached = 1
+        while len(frontier):
+            level += 1
+            nxt = np.unique((frontier[:, None] + steps) % n)
+            nxt = nxt[dist[nxt] < 0]
+            dist[nxt] = level
+            total += level * len(nxt)
+            reached += len(nxt)
+            frontier = nxt
+        if reached < n:
+            return GraphMetrics(False, float("inf"), float("inf"))
+        return GraphMetrics(True, float(level - 1), total / (n - 1))
+
+    def iter_booksim(self) -> Iterator[str]:
+        """
+        Yields the anynet description in chunks of CHUNK_SIZE routers.
+        """
+        line = "router %d node %d" + " router %d" * (2 * len(self.links))
+        for start in range(0, self.num_nodes, self.CHUNK_SIZE):
+            stop = min(start + self.CHUNK_SIZE, self.num_nodes)
+            ids = np.arange(start, stop, dtype=np.int64)[:, None]
+            rows = np.concatenate(
+                [ids, ids, self.neighbors(start, stop)], axis=1)
+            yield "".join([line % tuple(row) + "\n" for row in rows.tolist()])
+
+    def write_booksim(self, file: TextIO) -> None:
+        for chunk in self.iter_booksim():
+            file.write(chunk)
 
     def serialize_booksim(self) -> str:
-        res = ""
-        for node in self._nodes:
-            res += f"router {node.id} node {node.id}"
-            for link_id in node.get_links_ids():
-                res += f" router {link_id}"
-            res += "\n"
-        return res
-    
+        return "".join(self.iter_booksim())
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
@@ -66,4 +119,4 @@ if __name__ == "__main__":
         args.num_nodes,
         list(map(int, args.links.split(","))),
     )
-    print(topology.serialize_booksim())
+    topology.write_booksim(sys.stdout)
@@ -1,6 +1,12 @@
+import os
+import fcntl
+import hashlib
+import threading
 from abc import ABC, abstractmethod
 from pathlib import Path
 from dataclasses import dataclass
+from collections.abc import Callable
+from typing import TextIO
 from circulant_builder import Circulant
 
 
@@ -26,34 +32,108 @@ class TopoIndependentConfig:
     routing_func: str
     traffic: str
     sim_count: int
+    injection_rate: float
+    sample_period: int = 10000
+    seed: int = 0
+
+
+def write_once(path: Path, write: Callable[[TextIO], None]) -> Path:
+    """
+    Creates the file with the writer unless it already exists.
+    Concurrent callers, threads or processes, wait for the one
+    holding the lock, the file appears atomically.
+    """
+    if path.exists():
+        return path
+    with open(path.with_name(path.name + ".lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            if not path.exists():
+                tmp_path = path.with_name(
+                    f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+                with open(tmp_path, "w") as file:
+                    write(file)
+                os.replace(tmp_path, path)
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+    return path
 
 
 class ISimConfig(ABC):
+    # Parameters shared by every simulation of a sweep.
+    base_config = """\
+num_vcs          = 4;
+vc_buf_size      = 4;
+"""
     config_template = """\
 routing_function = {routing_func};
 traffic          = {traffic_type};
-sample_period    = 10000;
-injection_rate   = 0.0001;
+sample_period    = {sample_period};
+injection_rate   = {injection_rate};
 sim_count        = {sim_count};
-num_vcs          = 4;
-vc_buf_size      = 4;
-
-"""
+""" + base_config + "\n"
 
     def _fill_base_config(self, conf: TopoIndependentConfig) -> str:
-        return self.config_template.format(
+        res = self.config_template.format(
             routing_func=conf.routing_func,
             traffic_type=conf.traffic,
-            sim_count=conf.sim_count
+            sim_count=conf.sim_count,
+            injection_rate=conf.injection_rate,
+            sample_period=conf.sample_period,
         )
+        # Default seed is left out, fingerprints of older configs hold.
+        if conf.seed:
+            res += f"seed             = {conf.seed};\n"
+        return res
     
+    @staticmethod
+    def _get_indep_overrides(conf: TopoIndependentConfig) -> dict:
+        res = {
+            "routing_function": conf.routing_func,
+            "traffic": conf.traffic,
+            "sample_period": conf.sample_period,
+            "injection_rate": conf.injection_rate,
+            "sim_count": conf.sim_count,
+        }
+        if conf.seed:
+            res["seed"] = conf.seed
+        return res
+
+    @classmethod
+    def create_base_config(cls, configs_dir: Path) -> Path:
+        """
+        Writes the shared base config once per configs directory.
+        """
+        digest = hashlib.sha256(cls.base_config.encode()).hexdigest()
+        return write_once(configs_dir.joinpath(f"base_config_{digest[:12]}"),
+                          lambda file: file.write(cls.base_config))
+
+    @staticmethod
+    def _get_args(base_config: Path, overrides: dict) -> list[str]:
+        return [str(base_config)] + [f"{k}={v}" for k, v in overrides.items()]
+
     def get_indep_namepart(self, conf: TopoIndependentConfig):
-        return f"_F{conf.routing_func}_T{conf.traffic}_S{conf.sim_count}"
+        res = (f"_F{conf.routing_func}_T{conf.traffic}_S{conf.sim_count}"
+               f"_I{conf.injection_rate}_P{conf.sample_period}")
+        if conf.seed:
+            res += f"_R{conf.seed}"
+        return res
 
     @abstractmethod
-    def create_config(self, configs_dir: Path) -> Path:
+    def create_config(self, configs_dir: Path) -> list[str]:
         """
-        Creates config in filesystem and returns its path.
+        Creates files the simulation needs and returns BookSim
+        arguments: the shared base config followed by param=value
+        overrides of this simulation.
+        """
+        pass
+
+    @abstractmethod
+    def get_fingerprint(self) -> str:
+        """
+        Returns text that fully determines the simulation: rendered
+        config without filesystem paths plus contents, or a digest of
+        contents, of every file the config refers to.
         """
         pass
 
@@ -74,6 +154,7 @@ network_file = {anynet_filename};
         self.num_nodes = num_nodes
         self.links = links
         self.config = config
+        self._topology_digest: str | None = None
 
     @staticmethod
     def new_config(
@@ -81,7 +162,10 @@ network_file = {anynet_filename};
             links: str,
             routing_func: str,
             traffic_type: str,
-            sim_count: int) -> ISimConfig:
+            sim_count: int,
+            injection_rate: float,
+            sample_period: int = 10000,
+            seed: int = 0) -> ISimConfig:
         return CirculantConfig(
             num_nodes,
             list(map(int, links.split(","))),
@@ -89,6 +173,9 @@ network_file = {anynet_filename};
                 routing_func,
                 traffic_type,
                 sim_count,
+                injection_rate,
+                sample_period,
+                seed,
             ),
         )
 
@@ -98,19 +185,42 @@ network_file = {anynet_filename};
             res += f"_{link}"
         return res + self.get_indep_namepart(self.config)
 
-    def create_config(self, configs_dir: Path) -> Path:
-        config_path = configs_dir.joinpath("config_" + self.get_topology_name())
-        topology_path = configs_dir.joinpath("topo_" + self.get_topology_name())
-
-        config_content = self.topo_config.format(
-            anynet_filename=topology_path,
+    def _get_topology_digest(self) -> str:
+        # Large circulants are never held in memory as a whole.
+        if self._topology_digest is None:
+            h = hashlib.sha256()
+            for chunk in self.circulant.iter_booksim():
+                h.update(chunk.encode())
+            self._topology_digest = h.hexdigest()
+        return self._topology_digest
+
+    def _render_config(self, anynet_filename: str) -> str:
+        return self.topo_config.format(
+            anynet_filename=anynet_filename,
         ) + self._fill_base_config(self.config)
-        with open(topology_path, "w") as file:
-            file.write(self.circulant.serialize_booksim())
-        with open(config_path, "w") as file:
-            file.write(config_content)
 
-        return config_path
+    def get_fingerprint(self) -> str:
+        return (self._render_config("")
+                + f"topology sha256 {self._get_topology_digest()}\n")
+
+    def _create_topology(self, configs_dir: Path) -> Path:
+        """
+        Topology file is shared by all configs with the same circulant.
+        """
+        name = f"topo_circulant_c{self.num_nodes}"
+        for link in self.circulant.links:
+            name += f"_{link}"
+        return write_once(configs_dir.joinpath(name),
+                          self.circulant.write_booksim)
+
+    def create_config(self, configs_dir: Path) -> list[str]:
+        overrides = {
+            "topology": "anynet",
+            "network_file": self._create_topology(configs_dir),
+        }
+        overrides.update(self._get_indep_overrides(self.config))
+        return self._get_args(self.create_base_config(configs_dir),
+                              overrides)
 
 
 class CellTopoConfig(ISimConfig):
@@ -140,12 +250,18 @@ n = {n};
             n=self.n,
         )
 
-    def create_config(self, configs_dir: Path):
-        config_path = configs_dir.joinpath("config_" + self.get_topology_name())
-        config_content = self._get_topo_config() + self._fill_base_config(self.conf)
-        with open(config_path, "w") as file:
-            file.write(config_content)
-        return config_path
+    def get_fingerprint(self) -> str:
+        return self._get_topo_config() + self._fill_base_config(self.conf)
+
+    def create_config(self, configs_dir: Path) -> list[str]:
+        overrides = {
+            "topology": self._get_topo_name(),
+            "k": self.k,
+            "n": self.n,
+        }
+        overrides.update(self._get_indep_overrides(self.conf))
+        return self._get_args(self.create_base_config(configs_dir),
+                              overrides)
 
     def get_topology_name(self):
         return (f"{self._get_topo_name()}_k{self.k}_n{self.n}"
@@ -174,7 +290,10 @@ def new_cell_config(
         links: str,
         routing_func: str,
         traffic_type: str,
-        sim_count: int) -> ISimConfig:
+        sim_count: int,
+        injection_rate: float,
+        sample_period: int = 10000,
+        seed: int = 0) -> ISimConfig:
     parsed_links = list(map(int, links.split(",")))
     return cls(
         parsed_links[0],
@@ -183,6 +302,9 @@ def new_cell_config(
             routing_func,
             traffic_type,
             sim_count,
+            injection_rate,
+            sample_period,
+            seed,
         ),
     )
 
@@ -193,3 +315,18 @@ def new_mesh_config(*args, **kwargs) -> ISimConfig:
 
 def new_torus_config(*args, **kwargs) -> ISimConfig:
     return new_cell_config(TorusConfig, *args, **kwargs)
+
+
+def get_topology_size(name: str, num_nodes: int, links: str) -> tuple[int, int]:
+    """
+    Returns number of routers and number of bidirectional
+    router-to-router links of the topology.
+    """
+    parsed_links = list(map(int, links.split(",")))
+    if name == "circulant":
+        return num_nodes, num_nodes * len(set(parsed_links))
+    k, n = parsed_links[0], parsed_links[1]
+    num_routers = k ** n
+    if name == "torus":
+        return num_routers, n * num_routers
+    return num_routers, n * (k - 1) * k ** (n - 1)
@@ -0,0 +1,314 @@
+import os
+import json
+import time
+import socket
+import socketserver
+from pathlib import Path
+from threading import Thread, Lock, Event
+from collections import deque
+from collections.abc import Iterator
+from dataclasses import dataclass
+from loguru import logger
+from tqdm import tqdm
+from model import Config, Result, IResultRepo
+from simulator import SimRunner
+from runner import (
+    MultiSimRunner,
+    SimulationTask,
+    ProgressBarSync,
+    TopologyDedup,
+)
+from journal import SimJournal
+from scheduler import CostModel
+from topology_filter import TopologyFilter
+from usage import UsageReport
+
+
+# Protocol: newline-delimited JSON messages over TCP, every request
+# of a worker gets exactly one reply from the coordinator.
+#   {"op": "get", "worker": name} -> {"op": "job", "id", "config", "lease"}
+#                                  | {"op": "wait"} | {"op": "done"}
+#   {"op": "renew", "id"}          -> {"op": "ok"} | {"op": "lost"}
+#   {"op": "result", "id", "status", "result"} -> {"op": "ok"}
+
+
+def parse_address(address: str) -> tuple[str, int]:
+    host, port = address.rsplit(":", 1)
+    return host, int(port)
+
+
+@dataclass
+class Lease:
+    config: Config
+    worker: str
+    deadline: float
+
+
+class Coordinator:
+    """
+    Owns the config queue and the result repository, hands configs
+    out to workers under leases. Config whose lease expires without
+    a result or renewal goes back to the queue.
+    Thread-safe.
+    """
+    def __init__(self, configs: Iterator[Config], repo: IResultRepo,
+                 journal: SimJournal | None, lease_timeout: float,
+                 sync_bar: ProgressBarSync,
+                 dedup: TopologyDedup | None = None):
+        self._configs = configs
+        self._exhausted = False
+        self._repo = repo
+        self._journal = journal
+        self._dedup = dedup
+        self._lease_timeout = lease_timeout
+        self._bar = sync_bar
+        self._mx = Lock()
+        self._next_id = 0
+        self._requeued: deque[tuple[int, Config]] = deque()
+        self._leases: dict[int, Lease] = {}
+        self._finished: set[int] = set()
+        self.usage = UsageReport()
+
+    def _expire_leases(self) -> None:
+        now = time.monotonic()
+        for job_id, lease in list(self._leases.items()):
+            if lease.deadline < now:
+                logger.warning(f"Lease of job {job_id} held by "
+                               f"{lease.worker} expired, requeueing")
+                del self._leases[job_id]
+                self._requeued.append((job_id, lease.config))
+
+    def _take_job(self) -> tuple[int, Config] | None:
+        if self._requeued:
+            return self._requeued.popleft()
+        if self._exhausted:
+            return None
+        try:
+            cfg = next(self._configs)
+        except StopIteration:
+            self._exhausted = True
+            return None
+        self._next_id += 1
+        return self._next_id, cfg
+
+    def _get(self, worker: str) -> dict:
+        self._expire_leases()
+        job = self._take_job()
+        if job is None:
+            return {"op": "wait" if self._leases else "done"}
+        job_id, cfg = job
+        self._leases[job_id] = Lease(
+            cfg, worker, time.monotonic() + self._lease_timeout)
+        return {"op": "job", "id": job_id, "config": cfg.to_dict(),
+                "lease": self._lease_timeout}
+
+    def _renew(self, job_id: int) -> dict:
+        lease = self._leases.get(job_id)
+        if lease is None:
+            return {"op": "lost"}
+        lease.deadline = time.monotonic() + self._lease_timeout
+        return {"op": "ok"}
+
+    def _result(self, job_id: int, status: str,
+                result: dict | None) -> dict:
+        if job_id in self._finished:
+            # Late result of a requeued job, already done by another worker.
+            return {"op": "ok"}
+        lease = self._leases.pop(job_id, None)
+        if lease is None:
+            for i, (requeued_id, _) in enumerate(self._requeued):
+                if requeued_id == job_id:
+                    lease = Lease(self._requeued[i][1], "", 0.0)
+                    del self._requeued[i]
+                    break
+            else:
+                return {"op": "error", "reason": f"unknown job {job_id}"}
+        self._finished.add(job_id)
+        res = None
+        if result is not None:
+            res = Result.from_dict(result)
+            res.config = lease.config
+        MultiSimRunner._record(lease.config, status, res, self._repo,
+                               self._journal, self._dedup, self.usage)
+        with self._bar.mx:
+            self._bar.bar.update()
+        return {"op": "ok"}
+
+    def handle(self, msg: dict) -> dict:
+        with self._mx:
+            op = msg.get("op")
+            if op == "get":
+                return self._get(msg["worker"])
+            if op == "renew":
+                return self._renew(msg["id"])
+            if op == "result":
+                return self._result(msg["id"], msg["status"],
+                                    msg.get("result"))
+            return {"op": "error", "reason": f"unknown op {op!r}"}
+
+    def is_done(self) -> bool:
+        with self._mx:
+            self._expire_leases()
+            return (self._exhausted and not self._requeued
+                    and not self._leases)
+
+    def serve(self, address: tuple[str, int]) -> None:
+        server = _CoordinatorServer(address, _CoordinatorHandler)
+        server.coordinator = self
+        Thread(target=server.serve_forever, daemon=True).start()
+        logger.info(f"Coordinator listening on {address[0]}:{address[1]}.")
+        try:
+            while not self.is_done():
+                time.sleep(1.0)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    @staticmethod
+    def run(tasks: list[SimulationTask], repo: IResultRepo,
+            address: tuple[str, int], lease_timeout: float,
+            journal: SimJournal | None = None,
+            cost_model: CostModel | None = None,
+            dedup_isomorphic: bool = False,
+            topo_filter: TopologyFilter | None = None):
+        """
+        Serves configs of the tasks to workers until every config
+        has its result.
+        """
+        sync_bar = ProgressBarSync(tqdm(total=sum(map(len, tasks))), Lock())
+        dedup = TopologyDedup(repo, journal) if dedup_isomorphic else None
+        configs = MultiSimRunner._prepare_configs(
+            tasks, 1, journal, cost_model, sync_bar, dedup, topo_filter)
+        coordinator = Coordinator(
+            configs, repo, journal, lease_timeout, sync_bar, dedup)
+        try:
+            coordinator.serve(address)
+        except KeyboardInterrupt:
+            logger.error("Interrupted, finished simulations are saved. "
+                         "Run with --resume to continue.")
+            raise
+        finally:
+            sync_bar.bar.close()
+        coordinator.usage.log()
+        logger.info("Done.")
+
+
+class _CoordinatorHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            try:
+                reply = self.server.coordinator.handle(json.loads(line))
+            except (ValueError, KeyError, TypeError) as e:
+                reply = {"op": "error", "reason": f"bad message: {e}"}
+            self.wfile.write((json.dumps(reply) + "\n").encode())
+            self.wfile.flush()
+
+
+class _CoordinatorServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class Worker:
+    """
+    Pulls configs from the coordinator over one connection, simulates
+    them and pushes results back. Lease is renewed in background
+    while the simulation runs.
+    """
+    _POLL_INTERVAL = 5.0
+    _CONNECT_RETRIES = 30
+
+    def __init__(self, address: tuple[str, int], simulator: SimRunner,
+                 configs_dir: Path, name: str):
+        self._address = address
+        self._simulator = simulator
+        self._configs_dir = configs_dir
+        self._name = name
+        self._mx = Lock()
+        self._sock: socket.socket | None = None
+        self._stream = None
+
+    def _connect(self) -> None:
+        for attempt in range(self._CONNECT_RETRIES):
+            try:
+                self._sock = socket.create_connection(self._address)
+                self._stream = self._sock.makefile("rwb")
+                return
+            except ConnectionRefusedError:
+                if attempt + 1 == self._CONNECT_RETRIES:
+                    raise
+                time.sleep(1.0)
+
+    def _request(self, msg: dict) -> dict:
+        with self._mx:
+            self._stream.write((json.dumps(msg) + "\n").encode())
+            self._stream.flush()
+            line = self._stream.readline()
+        if not line:
+            raise ConnectionError("Coordinator closed connection")
+        return json.loads(line)
+
+    def _heartbeat(self, job_id: int, interval: float, stop: Event) -> None:
+        while not stop.wait(interval):
+            try:
+                if self._request({"op": "renew", "id": job_id})["op"] != "ok":
+                    logger.warning(f"Lease of job {job_id} was lost")
+                    return
+            except OSError:
+                return
+
+    def _process(self, job: dict) -> None:
+        cfg = Config.from_dict(job["config"])
+        stop = Event()
+        heartbeat = Thread(target=self._heartbeat,
+                           args=(job["id"], job["lease"] / 3, stop),
+                           daemon=True)
+        heartbeat.start()
+        try:
+            status, res = MultiSimRunner._simulate(
+                cfg, self._simulator, self._configs_dir)
+        finally:
+            stop.set()
+            heartbeat.join()
+        self._request({
+            "op": "result",
+            "id": job["id"],
+            "status": status,
+            "result": None if res is None else res.to_dict(),
+        })
+
+    def run(self) -> None:
+        self._connect()
+        try:
+            while True:
+                reply = self._request({"op": "get", "worker": self._name})
+                if reply["op"] == "job":
+                    self._process(reply)
+                elif reply["op"] == "wait":
+                    time.sleep(self._POLL_INTERVAL)
+                else:
+                    break
+        except (ConnectionError, OSError) as e:
+            logger.warning(f"Worker {self._name} lost coordinator: {e}")
+        finally:
+            self._sock.close()
+
+    @staticmethod
+    def run_many(address: tuple[str, int], simulator_path: Path,
+                 configs_dir: Path, jobs: int, **sim_kwargs) -> None:
+        """
+        Runs `jobs` workers in threads of this process until the
+        coordinator has no more configs.
+        """
+        simulator = SimRunner(simulator_path, **sim_kwargs)
+        prefix = f"{socket.gethostname()}:{os.getpid()}"
+        workers = [
+            Thread(target=Worker(address, simulator, configs_dir,
+                                 f"{prefix}/{i}").run)
+            for i in range(jobs)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        logger.info("Done.")
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+import os
+import sys
+import time
+import random
+from collections.abc import Iterator
+
+
+# Behaviour is set through the environment, so runners start the fake
+# with the same arguments as BookSim.
+LATENCY_ENV = "FAKE_BOOKSIM_LATENCY"
+PERIODS_ENV = "FAKE_BOOKSIM_PERIODS"
+FILLER_ENV = "FAKE_BOOKSIM_FILLER"
+DRAIN_ENV = "FAKE_BOOKSIM_DRAIN"
+FAILURE_ENV = "FAKE_BOOKSIM_FAILURE"
+HANG_ENV = "FAKE_BOOKSIM_HANG"
+HANG_TIME_ENV = "FAKE_BOOKSIM_HANG_TIME"
+
+_STATS = [
+    ("Packet latency", 1.0),
+    ("Network latency", 0.9),
+    ("Flit latency", 1.0),
+    ("Fragmentation", 0.0),
+]
+_RATES = [
+    "Injected packet rate",
+    "Accepted packet rate",
+    "Injected flit rate",
+    "Accepted flit rate",
+]
+
+
+def _latency(rate: float) -> float:
+    """
+    Packet latency of an M/D/1-like network saturating at rate 0.5.
+    """
+    load = min(rate / 0.5, 0.99)
+    return 10.0 + 5.0 * load / (1.0 - load)
+
+
+def _stat_lines(name: str, avg: float, low: float, high: float,
+                suffix: str = "", at: bool = False) -> list[str]:
+    """
+    Average, minimum and maximum lines of a statistic, extremes of
+    sample period rates are reported with their nodes.
+    """
+    low_suffix = " (at node 0)" if at else suffix
+    high_suffix = " (at node 1)" if at else suffix
+    return [
+        f"{name} average = {avg:g}{suffix}\n",
+        f"\tminimum = {low:g}{low_suffix}\n",
+        f"\tmaximum = {high:g}{high_suffix}\n",
+    ]
+
+
+def _drain_lines() -> list[str]:
+    """
+    In-flight flits BookSim lists every 1000 cycles of draining.
+    """
+    return [
+        "Class 0:\n",
+        "Remaining flits: 10 11 12 (3 flits)\n",
+        "Measured flits: 10 11 (2 flits)\n",
+    ]
+
+
+def render(rate: float, sim_count: int = 1, periods: int = 3,
+           filler: int = 0, rng: random.Random | None = None,
+           drain: int = 0) -> Iterator[str]:
+    """
+    Lines of BookSim output for a run at the injection rate: `filler`
+    lines of network listing, `periods` sample periods and `drain`
+    listings of draining of every simulation and the overall
+    statistics of traffic class 0.
+    """
+    rng = rng or random.Random()
+    for i in range(filler):
+        yield f"\t Router {i} lat 1\n"
+    for _ in range(sim_count):
+        for _ in range(periods):
+            latency = _latency(rate) * rng.uniform(0.95, 1.05)
+            yield "Class 0:\n"
+            for name, scale in _STATS:
+                value = latency * scale
+                yield from _stat_lines(name, value, value / 2, value * 3)
+            for name in _RATES:
+                yield from _stat_lines(name, rate, rate / 2, rate * 2,
+                                       at=True)
+            yield "Injected packet length average = 1\n"
+            yield "Accepted packet length average = 1\n"
+            yield "Total in-flight flits = 0 (0 measured)\n"
+            yield f"latency change    = {rng.uniform(0, 0.05):g}\n"
+            yield f"throughput change = {rng.uniform(0, 0.05):g}\n"
+        if drain:
+            yield "Draining remaining packets ...\n"
+            for _ in range(drain):
+                yield from _drain_lines()
+        yield "Time taken is 10000 cycles\n"
+    latency = _latency(rate)
+    samples = f" ({sim_count} samples)"
+    yield "====== Overall Traffic Statistics ======\n"
+    yield "====== Traffic class 0 ======\n"
+    for name, scale in _STATS:
+        value = latency * scale
+        yield from _stat_lines(name, value, value / 2, value * 3, samples)
+    for name in _RATES:
+        yield from _stat_lines(name, rate, rate / 2, rate * 2, samples)
+    yield f"Injected packet size average = 1{samples}\n"
+    yield f"Accepted packet size average = 1{samples}\n"
+    yield f"Hops average = 2{samples}\n"
+    yield "Total run time 0\n"
+
+
+def _simulate(overrides: list[str]) -> bool:
+    """
+    Prints output of one run, returns False when it failed.
+    """
+    params = dict(arg.split("=", 1) for arg in overrides if "=" in arg)
+    rng = random.Random()
+    if rng.random() < float(os.environ.get(HANG_ENV, 0)):
+        time.sleep(float(os.environ.get(HANG_TIME_ENV, 3600)))
+    time.sleep(float(os.environ.get(LATENCY_ENV, 0)))
+    if rng.random() < float(os.environ.get(FAILURE_ENV, 0)):
+        print("Error: fake failure", flush=True)
+        return False
+    sys.stdout.writelines(render(
+        float(params.get("injection_rate", 0.1)),
+        int(params.get("sim_count", 1)),
+        int(os.environ.get(PERIODS_ENV, 3)),
+        int(os.environ.get(FILLER_ENV, 0)),
+        rng,
+        int(os.environ.get(DRAIN_ENV, 0)),
+    ))
+    print("Resource usage: user 0 s, system 0 s, peak RSS 1024 kB",
+          flush=True)
+    return True
+
+
+if __name__ == "__main__":
+    # argv is the base config, overrides and --batch, as for BookSim.
+    args = sys.argv[2:]
+    if "--batch" not in args:
+        # BookSim exits with -1 after a successful run.
+        sys.exit(255 if _simulate(args) else 1)
+    for job, line in enumerate(sys.stdin):
+        print(f"BATCH BEGIN {job}")
+        if not _simulate(line.split()):
+            sys.exit(1)
+        print(f"BATCH END {job} 1", flush=True)
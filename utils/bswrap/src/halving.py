@@ -0,0 +1,169 @@
+import csv
+import math
+from pathlib import Path
+from threading import Lock
+from dataclasses import dataclass, replace
+from concurrent.futures import ThreadPoolExecutor
+from loguru import logger
+from tqdm import tqdm
+from model import Config, IResultRepo
+from simulator import (
+    SimRunner,
+    BadSimSummary,
+    SimSummaryNotFound,
+    SimAborted,
+)
+from sim_output import AbortRule
+from batch_runner import BatchSimRunner
+from runner import MultiSimRunner, SimulationTask
+from cache import ResultCache
+from topology_filter import TopologyFilter
+
+
+@dataclass
+class HalvingParams:
+    """
+    Every rung keeps 1/eta of the candidates and runs them with eta
+    times longer sample period, starting from about
+    min_sample_period up to the sample period of the configs.
+    Lower metric is better.
+    """
+    eta: int = 3
+    min_sample_period: int = 1000
+    metric: str = "packet_latency_avg"
+
+
+@dataclass
+class RankedConfig:
+    """
+    Candidate that reached the last rung, ranked within its group.
+    Score is None when the final simulation failed.
+    """
+    config: Config
+    score: float | None
+    rank: int
+
+    def to_dict(self) -> dict:
+        d = self.config.to_dict()
+        d["score"] = self.score
+        d["rank"] = self.rank
+        return d
+
+
+class SuccessiveHalving:
+    """
+    Multi-fidelity search over the configs of the tasks. Candidates
+    compete within groups of configs that differ only in topology,
+    so latencies under the same traffic and load are compared.
+    Every simulation is saved to the result repository, its sample
+    period tells the fidelity.
+    """
+    def __init__(self, simulator: SimRunner, configs_dir: Path,
+                 repo: IResultRepo, params: HalvingParams, jobs: int):
+        self._simulator = simulator
+        self._configs_dir = configs_dir
+        self._repo = repo
+        self._repo_mx = Lock()
+        self._params = params
+        self._jobs = jobs
+
+    def _score(self, cfg: Config) -> float:
+        try:
+            res = self._simulator.sim(cfg, self._configs_dir)
+        except (BadSimSummary, SimSummaryNotFound, SimAborted):
+            return math.inf
+        except ValueError:
+            logger.warning(f"Error on circulant config: {cfg.topo}")
+            return math.inf
+        with self._repo_mx:
+            self._repo.save(res)
+        return getattr(res, self._params.metric)
+
+    def rungs(self, full_period: int) -> list[int]:
+        """
+        Sample periods of the rungs, the last one is full fidelity.
+        """
+        res = [full_period]
+        while res[-1] // self._params.eta >= self._params.min_sample_period:
+            res.append(res[-1] // self._params.eta)
+        return res[::-1]
+
+    @staticmethod
+    def _group_key(cfg: Config) -> tuple:
+        return (cfg.topo.name, cfg.topo.num_nodes, cfg.routing_function,
+                cfg.traffic_type, cfg.sim_count, cfg.injection_rate)
+
+    def _run_rung(self, candidates: list[Config], period: int,
+                  desc: str) -> list[float]:
+        configs = [replace(cfg, sample_period=period) for cfg in candidates]
+        with ThreadPoolExecutor(max_workers=self._jobs) as pool, \
+                tqdm(total=len(configs), desc=desc) as bar:
+            scores = []
+            for score in pool.map(self._score, configs):
+                scores.append(score)
+                bar.update()
+        return scores
+
+    def search(self, configs: list[Config]) -> list[RankedConfig]:
+        if not configs:
+            return []
+        rungs = self.rungs(max(cfg.sample_period for cfg in configs))
+        groups: dict[tuple, list[Config]] = {}
+        for cfg in configs:
+            groups.setdefault(self._group_key(cfg), []).append(cfg)
+
+        for i, period in enumerate(rungs):
+            candidates = [cfg for group in groups.values() for cfg in group]
+            logger.info(f"Rung {i}: {len(candidates)} candidates, "
+                        f"sample period {period}.")
+            scores = self._run_rung(
+                candidates, period, f"Rung {i + 1}/{len(rungs)}")
+            scored: dict[tuple, list[tuple[float, Config]]] = {}
+            for cfg, score in zip(candidates, scores):
+                scored.setdefault(self._group_key(cfg), []).append(
+                    (score, cfg))
+            for key, group in scored.items():
+                group.sort(key=lambda x: x[0])
+                if i + 1 < len(rungs):
+                    keep = math.ceil(len(group) / self._params.eta)
+                    groups[key] = [cfg for _, cfg in group[:keep]]
+
+        res = []
+        for group in scored.values():
+            for rank, (score, cfg) in enumerate(group, start=1):
+                res.append(RankedConfig(
+                    cfg, None if math.isinf(score) else score, rank))
+        return res
+
+    @staticmethod
+    def run(simulator_path: Path, tasks: list[SimulationTask],
+            configs_dir: Path, repo: IResultRepo, jobs: int,
+            params: HalvingParams,
+            cache: ResultCache | None = None,
+            abort_rules: list[AbortRule] | None = None,
+            topo_filter: TopologyFilter | None = None,
+            persistent_workers: bool = False
+            ) -> list[RankedConfig]:
+        configs = MultiSimRunner._generate_configs(tasks)
+        if topo_filter is not None:
+            configs = topo_filter.select(configs, lambda _: None)
+        simulator_cls = BatchSimRunner if persistent_workers else SimRunner
+        simulator = simulator_cls(simulator_path, cache, abort_rules)
+        halving = SuccessiveHalving(
+            simulator, configs_dir, repo, params, jobs)
+        try:
+            res = halving.search(list(configs))
+        finally:
+            simulator.close()
+        logger.info("Done.")
+        return res
+
+    @staticmethod
+    def save_csv(ranking: list[RankedConfig], file: Path) -> None:
+        if not ranking:
+            return
+        with open(file, "w") as f:
+            writer = csv.DictWriter(f, ranking[0].to_dict().keys())
+            writer.writeheader()
+            for ranked in ranking:
+                writer.writerow(ranked.to_dict())
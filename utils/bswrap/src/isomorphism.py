@@ -0,0 +1,42 @@
+from dataclasses import replace
+import numpy as np
+from model import Config
+
+
+# Traffic patterns whose distribution does not depend on node labels,
+# so relabeled (isomorphic) networks give the same results.
+LABEL_INVARIANT_TRAFFIC = {"uniform"}
+
+
+def canonical_links(num_nodes: int, links: list[int]) -> list[int]:
+    """
+    Canonical generator set of the circulant C_n(links). Multiplying
+    generators by a unit modulo n gives an isomorphic circulant (Adam
+    equivalence), the lexicographically smallest of the sorted sets
+    {min(u*s mod n, n - u*s mod n)} is the representative. Isomorphic
+    circulants not related by a multiplier keep distinct forms.
+    """
+    n = num_nodes
+    gens = np.array(sorted(set(links)), dtype=np.int64)
+    units = np.arange(1, n // 2 + 1, dtype=np.int64)
+    # Units u and n - u give the same set, half of them is enough.
+    units = units[np.gcd(units, n) == 1]
+    sets = np.outer(units, gens) % n
+    sets = np.minimum(sets, n - sets)
+    sets.sort(axis=1)
+    best = np.lexsort(sets.T[::-1])[0]
+    return sets[best].tolist()
+
+
+def canonical_config(cfg: Config) -> Config:
+    """
+    Config with canonical circulant links when the results do not
+    depend on node labels, the config itself otherwise.
+    """
+    if (cfg.topo.name != "circulant"
+            or cfg.traffic_type not in LABEL_INVARIANT_TRAFFIC):
+        return cfg
+    links = canonical_links(
+        cfg.topo.num_nodes, list(map(int, cfg.topo.links.split(","))))
+    return replace(cfg, topo=replace(
+        cfg.topo, links=",".join(map(str, links))))
@@ -0,0 +1,52 @@
+import json
+from pathlib import Path
+from threading import Lock
+from loguru import logger
+from model import Config
+
+
+class SimJournal:
+    """
+    Append-only journal of finished simulations.
+    Each line is a JSON object with the config and its outcome,
+    written and flushed as soon as the simulation finishes.
+    Thread-safe.
+    """
+    DONE = "done"
+    FAILED = "failed"
+    ABORTED = "aborted"
+    TIMEOUT = "timeout"
+
+    def __init__(self, file: Path, resume: bool = False):
+        self._finished: set[str] = set()
+        if resume and file.exists():
+            self._load(file)
+        self._file = open(file, "a" if resume else "w")
+        self._mx = Lock()
+
+    def _load(self, file: Path) -> None:
+        with open(file) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    self._finished.add(
+                        json.dumps(entry["config"], sort_keys=True))
+                except (ValueError, KeyError):
+                    # Last line may be cut by the interrupted run.
+                    logger.warning(f"Skipping damaged journal line: {line!r}")
+
+    def __len__(self) -> int:
+        return len(self._finished)
+
+    def is_finished(self, cfg: Config) -> bool:
+        return cfg.key() in self._finished
+
+    def record(self, cfg: Config, status: str) -> None:
+        line = json.dumps({"config": cfg.to_dict(), "status": status})
+        with self._mx:
+            self._finished.add(cfg.key())
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
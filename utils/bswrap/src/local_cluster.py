@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+import os
+import sys
+import time
+import signal
+import socket
+import argparse
+import tempfile
+import subprocess as sp
+from pathlib import Path
+from threading import Thread
+import numpy as np
+from loguru import logger
+from model import CSVResultRepo
+from runner import SimulationTask
+from distributed import Coordinator
+import fake_booksim
+
+FAKE_BOOKSIM = Path(__file__).with_name("fake_booksim.py")
+MAIN = Path(__file__).with_name("main.py")
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _tasks(configs: int) -> list[SimulationTask]:
+    rates = np.linspace(0.001, 0.6, configs).round(6).tolist()
+    return [SimulationTask(["circulant"], [16], ["1,3"], ["min"],
+                           ["uniform"], [1], rates)]
+
+
+def _start_worker(address: str, jobs: int, configs_dir: Path,
+                  directory: Path) -> sp.Popen:
+    """
+    Worker process started as on a remote host, all workers share
+    one configs directory.
+    """
+    return sp.Popen([sys.executable, str(MAIN), "-m", "worker",
+                     "-e", str(FAKE_BOOKSIM), "-a", address,
+                     "-j", str(jobs), "-d", str(configs_dir)],
+                    cwd=directory, stdout=sp.DEVNULL, stderr=sp.DEVNULL)
+
+
+def run_cluster(configs: int, workers: int, jobs: int,
+                lease_timeout: float, kill_after: float | None,
+                directory: Path) -> bool:
+    """
+    Runs a sweep of `configs` configs through a coordinator and
+    `workers` worker processes on localhost. With `kill_after`, the
+    first worker is killed after that many seconds, so its configs
+    come back to the queue when their leases expire. Returns whether
+    every config has exactly one result and the shared configs
+    directory survived the workers.
+    """
+    address = f"127.0.0.1:{_free_port()}"
+    host, port = address.rsplit(":", 1)
+    output = directory / "results.csv"
+    configs_dir = directory / "configs"
+    configs_dir.mkdir()
+    repo = CSVResultRepo(output)
+    coordinator = Thread(target=Coordinator.run, args=(
+        _tasks(configs), repo, (host, int(port)), lease_timeout))
+    coordinator.start()
+    procs = [_start_worker(address, jobs, configs_dir, directory)
+             for _ in range(workers)]
+    if kill_after is not None:
+        time.sleep(kill_after)
+        procs[0].send_signal(signal.SIGKILL)
+        logger.info(f"Killed worker {procs[0].pid}.")
+    coordinator.join()
+    for proc in procs:
+        proc.wait()
+    repo.close()
+
+    with open(output) as file:
+        rows = sum(1 for _ in file) - 1
+    leftovers = [path.name for path in configs_dir.iterdir()]
+    logger.info(f"{rows} results of {configs} configs, configs "
+                f"directory holds {leftovers or 'nothing'}.")
+    # A killed worker can not clean up after itself.
+    expected_leftovers = 1 if kill_after is not None else 0
+    return rows == configs and len(leftovers) == expected_leftovers
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog="bswrap-local-cluster",
+        description="Checks coordinator and worker modes on localhost: "
+        "a coordinator and several worker processes sharing one configs "
+        "directory run a sweep against a fake BookSim.",
+    )
+    parser.add_argument("-n", "--configs", type=int, default=30,
+                        help="[Default: 30]")
+    parser.add_argument("-w", "--workers", type=int, default=3,
+                        help="Worker processes. [Default: 3]")
+    parser.add_argument("-j", "--jobs", type=int, default=2,
+                        help="Jobs of every worker. [Default: 2]")
+    parser.add_argument("--latency", type=float, default=0.2,
+                        help="Seconds every fake simulation sleeps. "
+                        "[Default: 0.2]")
+    parser.add_argument("--lease-timeout", type=float, default=3.0,
+                        help="[Default: 3]")
+    parser.add_argument("--kill-after", type=float, default=None,
+                        help="Kill the first worker after this many "
+                        "seconds to check that its configs are "
+                        "requeued. [Default: no worker is killed]")
+    args = parser.parse_args()
+
+    os.environ[fake_booksim.LATENCY_ENV] = str(args.latency)
+    logger.remove()
+    logger.add(sys.stderr, level="INFO")
+    with tempfile.TemporaryDirectory() as directory:
+        ok = run_cluster(args.configs, args.workers, args.jobs,
+                         args.lease_timeout, args.kill_after,
+                         Path(directory))
+    print("OK" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
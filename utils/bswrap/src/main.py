@@ -1,11 +1,23 @@
+import os
 import sys
 import shutil
 import argparse
 from pathlib import Path
 from runner import MultiSimRunner
+from async_runner import AsyncMultiSimRunner
+from saturation import SaturationSearch, SaturationParams
+from halving import SuccessiveHalving, HalvingParams
 from loguru import logger
-from model import CSVResultRepo
-from user_config import TASK_CONFIG
+from model import CSVResultRepo, SQLiteResultRepo, ColumnarResults
+from cache import ResultCache
+from journal import SimJournal
+from scheduler import CostModel, MemoryModel, MemoryBudget
+from topology_filter import TopologyFilter
+from distributed import Coordinator, Worker, parse_address
+from replication import StoppingRule, STAT_FIELDS
+from metrics import SweepMetrics, MetricsServer
+from surrogate import SurrogateFilter
+from user_config import TASK_CONFIG, ABORT_RULES
 
 
 if __name__ == "__main__":
@@ -14,37 +26,413 @@ if __name__ == "__main__":
         description="Booksim multiple runner: Runs multiple "
         "instances of booksim simultaneously",
     )
-    parser.add_argument("-e", "--exec-path", type=Path, required=True,
-                        help="Path to the BookSim simulator executable.")
+    parser.add_argument("-m", "--mode",
+                        choices=["sweep", "saturation", "halving",
+                                 "coordinator", "worker"],
+                        default="sweep", help="'sweep' simulates every "
+                        "config of the task, 'saturation' searches "
+                        "saturation injection rate of every config, "
+                        "'halving' finds the best topologies with "
+                        "successive halving of short simulations. "
+                        "'coordinator' distributes the sweep to "
+                        "'worker' processes, possibly on other hosts. "
+                        "[Default: 'sweep']")
+    parser.add_argument("-e", "--exec-path", type=Path, default=None,
+                        help="Path to the BookSim simulator executable. "
+                        "Required in all modes except 'coordinator'.")
     parser.add_argument("-j", "--jobs", type=int, default=1,
                         help="Number of jobs running simulation tasks. "
                         "Recomended to be equal to number of "
-                        "physical CPUs. [Default: 1]")
+                        "physical CPUs. With --memory-budget it stays "
+                        "the upper bound of concurrent simulations. "
+                        "[Default: 1]")
     parser.add_argument("-d", "--configs-directory", type=Path,
                         default="tmp", help="Path to the directory "
-                        "where simulation configs are stored. "
+                        "where simulation configs are stored. Workers "
+                        "use a subdirectory of their own. "
                         "[Default: 'tmp']")
+    parser.add_argument("--keep-configs", action="store_true",
+                        help="Keep the configs directory with the base "
+                        "config and topologies after the run.")
     parser.add_argument("-o", "--output", type=Path, default="result.csv",
-                        help="Name of the output file."
+                        help="Name of the output file. Results are "
+                        "stored in SQLite database when it has '.db' "
+                        "or '.sqlite' suffix, in CSV otherwise. "
                         "[Default: 'result.csv']")
+    parser.add_argument("--export-csv", type=Path, default=None,
+                        help="Export all results of the SQLite output "
+                        "to this CSV file after the run.")
+    parser.add_argument("--export-columnar", type=Path, default=None,
+                        help="Export all results of the output to this "
+                        "directory in columnar format after the run, "
+                        "for analysis.py.")
+    parser.add_argument("-c", "--cache-directory", type=Path,
+                        default=None, help="Path to the persistent "
+                        "result cache. Simulations already present in "
+                        "the cache are not run again. "
+                        "[Default: caching disabled]")
+    parser.add_argument("-r", "--resume", action="store_true",
+                        help="Resume interrupted sweep: skip configs "
+                        "recorded in the journal and append new "
+                        "results to the same output.")
+    parser.add_argument("--journal", type=Path, default=None,
+                        help="Path to the completion journal. "
+                        "[Default: output file name with "
+                        "'.journal' suffix]")
+    parser.add_argument("--engine", choices=["thread", "async"],
+                        default="thread", help="Simulation engine: "
+                        "thread pool or asyncio subprocesses. "
+                        "[Default: 'thread']")
+    parser.add_argument("-t", "--timeout", type=float, default=None,
+                        help="Wall-clock limit of one simulation in "
+                        "seconds, async engine only. "
+                        "[Default: no limit]")
+    parser.add_argument("-s", "--schedule", choices=["fifo", "ljf"],
+                        default="fifo", help="Order of simulations: "
+                        "as generated or longest job first, by runtime "
+                        "estimated from topology size and history of "
+                        "earlier runs. [Default: 'fifo']")
+    parser.add_argument("--history", type=Path,
+                        default="bswrap_history.jsonl",
+                        help="Runtime history used and extended by "
+                        "'ljf' schedule. "
+                        "[Default: 'bswrap_history.jsonl']")
+    parser.add_argument("--persistent-workers", action="store_true",
+                        help="Keep BookSim processes running in batch "
+                        "mode and feed them simulations, instead of "
+                        "starting a process per simulation. Saves "
+                        "startup time of short simulations, thread "
+                        "engine only.")
+    parser.add_argument("--details", action="store_true",
+                        help="Collect statistics of all traffic classes, "
+                        "latency and hop histograms, per-node rates and "
+                        "per-sample-period series from BookSim's "
+                        "structured output and store them with the "
+                        "results. Sweep mode with SQLite output only.")
+    parser.add_argument("--dedup-isomorphic", action="store_true",
+                        help="Simulate only one of circulant configs "
+                        "with isomorphic topologies (generators equal "
+                        "up to a multiplier) under uniform traffic and "
+                        "save its results for all of them.")
+    parser.add_argument("--metrics-address", default=None,
+                        help="Serve progress metrics of the sweep in "
+                        "Prometheus text format at "
+                        "http://HOST:PORT/metrics, e.g. "
+                        "'127.0.0.1:9100'. Sweep mode only. "
+                        "[Default: disabled]")
+    parser.add_argument("--memory-budget", type=float, default=None,
+                        help="Total memory of concurrent simulations in "
+                        "MiB. A simulation starts only while its memory, "
+                        "estimated from topology size and peak RSS of "
+                        "earlier runs, fits into the budget. The budget "
+                        "only holds simulations back, at most --jobs run "
+                        "at once. Sweep mode only. [Default: no budget]")
+    parser.add_argument("--memory-limit", type=float, default=None,
+                        help="Address space limit of every BookSim "
+                        "process in MiB, a simulation exceeding it "
+                        "fails instead of exhausting the machine. "
+                        "Sweep mode only. [Default: no limit]")
+    parser.add_argument("--memory-history", type=Path,
+                        default="bswrap_memory.jsonl",
+                        help="Peak memory history used and extended by "
+                        "--memory-budget. "
+                        "[Default: 'bswrap_memory.jsonl']")
+    topo_filter_args = parser.add_argument_group(
+        "topology filter", "Circulants are checked by analytical distance "
+        "metrics before simulation, disconnected ones are rejected "
+        "when any of these is set.")
+    topo_filter_args.add_argument("--max-diameter", type=float,
+                                  default=None, help="Reject circulants "
+                                  "with larger diameter.")
+    topo_filter_args.add_argument("--max-avg-distance", type=float,
+                                  default=None, help="Reject circulants "
+                                  "with larger average shortest path.")
+    topo_filter_args.add_argument("--top-k", type=int, default=None,
+                                  help="Simulate only K circulants with "
+                                  "the lowest average shortest path "
+                                  "of every size.")
+    surrogate_args = parser.add_argument_group(
+        "surrogate", "Sweep mode only. A regression model trained on "
+        "stored results predicts packet latency and hops of every "
+        "config with uncertainty. Predictions of all configs are saved "
+        "next to the output with '_surrogate.csv' suffix.")
+    surrogate_args.add_argument("--surrogate", action="store_true",
+                                help="Simulate only configs the model "
+                                "is unsure about or predicts to be "
+                                "competitive with the best topology of "
+                                "the same size, routing, traffic and "
+                                "injection rate.")
+    surrogate_args.add_argument("--surrogate-results", type=Path,
+                                default=None, help="SQLite or CSV "
+                                "results to train on. "
+                                "[Default: the output]")
+    surrogate_args.add_argument("--surrogate-uncertainty", type=float,
+                                default=0.1, help="Relative standard "
+                                "deviation of predicted latency above "
+                                "which a config is simulated. "
+                                "[Default: 0.1]")
+    surrogate_args.add_argument("--surrogate-slack", type=float,
+                                default=0.05, help="Simulate configs "
+                                "whose optimistic latency is within "
+                                "this fraction of the best one. "
+                                "[Default: 0.05]")
+    replication = parser.add_argument_group(
+        "replications", "Sweep mode with thread engine only. Results of "
+        "replications are merged, with confidence intervals of the "
+        "main metrics.")
+    replication.add_argument("--replications", type=int, default=1,
+                             help="Split every config into this many "
+                             "replications with consecutive seeds and "
+                             "sim_count divided between them, and run "
+                             "them in parallel. [Default: 1]")
+    replication.add_argument("--ci-target", type=float, default=None,
+                             help="Run further waves of --replications "
+                             "replications until the 95%% confidence "
+                             "interval half-width of every --ci-metrics "
+                             "is within this fraction of its mean. "
+                             "[Default: fixed number of replications]")
+    replication.add_argument("--ci-metrics", nargs="+",
+                             default=["packet_latency_avg"],
+                             help="Result fields checked by --ci-target. "
+                             "[Default: packet_latency_avg]")
+    replication.add_argument("--max-replications", type=int, default=10,
+                             help="Limit of replications with "
+                             "--ci-target. [Default: 10]")
+    distributed = parser.add_argument_group(
+        "coordinator and worker modes")
+    distributed.add_argument("-a", "--address", default="127.0.0.1:5555",
+                             help="Address the coordinator listens on "
+                             "and workers connect to. "
+                             "[Default: '127.0.0.1:5555']")
+    distributed.add_argument("--lease-timeout", type=float, default=600.0,
+                             help="Seconds without heartbeat after which "
+                             "a config is taken back from a worker and "
+                             "given to another one. [Default: 600]")
+    saturation = parser.add_argument_group(
+        "saturation mode", "Search parameters, same as in sweep.sh.")
+    saturation.add_argument("--initial-step", type=float, default=0.05,
+                            help="[Default: 0.05]")
+    saturation.add_argument("--minimum-step", type=float, default=0.001,
+                            help="[Default: 0.001]")
+    saturation.add_argument("--zero-load-inj", type=float, default=0.0025,
+                            help="[Default: 0.0025]")
+    saturation.add_argument("--no-backtrack", action="store_true",
+                            help="Stop on the first failed simulation "
+                            "instead of reducing the step.")
+    halving = parser.add_argument_group(
+        "halving mode", "Every rung keeps the best 1/eta of topologies "
+        "and simulates them eta times longer.")
+    halving.add_argument("--eta", type=int, default=3,
+                         help="[Default: 3]")
+    halving.add_argument("--min-sample-period", type=int, default=1000,
+                         help="Sample period of the first rung is not "
+                         "shorter than this. [Default: 1000]")
+    halving.add_argument("--halving-metric", default="packet_latency_avg",
+                         help="Result field to minimize. "
+                         "[Default: 'packet_latency_avg']")
     args = parser.parse_args()
+    if args.exec_path is None and args.mode != "coordinator":
+        parser.error("--exec-path is required")
+    if args.timeout is not None and args.engine != "async":
+        parser.error("--timeout requires --engine async")
+    if args.persistent_workers and args.engine != "thread":
+        parser.error("--persistent-workers requires --engine thread")
+    if args.replications < 1:
+        parser.error("--replications must be positive")
+    if ((args.replications > 1 or args.ci_target is not None)
+            and (args.mode != "sweep" or args.engine != "thread")):
+        parser.error("--replications and --ci-target require sweep mode "
+                     "and --engine thread")
+    if args.mode in ("saturation", "halving") and (
+            args.engine != "thread" or args.resume
+            or args.journal is not None or args.dedup_isomorphic):
+        parser.error("--engine async, --resume, --journal and "
+                     "--dedup-isomorphic are not supported in "
+                     f"{args.mode} mode")
+    unknown_metrics = set(args.ci_metrics) - set(STAT_FIELDS)
+    if unknown_metrics:
+        parser.error(f"unknown --ci-metrics: {', '.join(unknown_metrics)}")
+    use_sqlite = args.output.suffix in (".db", ".sqlite")
+    if args.export_csv is not None and not use_sqlite:
+        parser.error("--export-csv requires SQLite output")
+    if args.details and (args.mode != "sweep" or not use_sqlite):
+        parser.error("--details requires sweep mode and SQLite output")
+    if args.metrics_address is not None and args.mode != "sweep":
+        parser.error("--metrics-address requires sweep mode")
+    if ((args.memory_budget is not None or args.memory_limit is not None)
+            and args.mode != "sweep"):
+        parser.error("--memory-budget and --memory-limit require "
+                     "sweep mode")
+    if args.surrogate and args.mode != "sweep":
+        parser.error("--surrogate requires sweep mode")
 
     configs_dir = args.configs_directory.absolute()
-    if configs_dir.exists():
+    if args.mode == "worker":
+        # Workers on one host may share the directory, each one
+        # creates and removes only its own.
+        configs_dir = configs_dir / f"worker_{os.getpid()}"
+    if configs_dir.exists() and not args.resume:
         shutil.rmtree(configs_dir)
-    configs_dir.mkdir()
+    configs_dir.mkdir(parents=True, exist_ok=True)
 
     logger.remove()
     logger.add(sys.stderr, level="ERROR")
     logger.add("bswrap.log", level="INFO")
-    repo = CSVResultRepo(args.output.absolute())
+    topo_filter = None
+    if (args.max_diameter is not None or args.max_avg_distance is not None
+            or args.top_k is not None):
+        topo_filter = TopologyFilter(
+            args.max_diameter, args.max_avg_distance, args.top_k)
+    if use_sqlite:
+        repo = SQLiteResultRepo(args.output.absolute())
+    else:
+        try:
+            repo = CSVResultRepo(args.output.absolute())
+        except ValueError as e:
+            parser.error(str(e))
+    cache = None
+    if args.cache_directory is not None and args.exec_path is not None:
+        cache = ResultCache(args.cache_directory.absolute(),
+                            args.exec_path.absolute())
 
-    MultiSimRunner.run(
-        args.exec_path.absolute(),
-        TASK_CONFIG,
-        configs_dir,
-        repo,
-        args.jobs,
-    )
+    if args.mode == "saturation":
+        points = SaturationSearch.run(
+            args.exec_path.absolute(),
+            TASK_CONFIG,
+            configs_dir,
+            repo,
+            args.jobs,
+            SaturationParams(
+                args.initial_step,
+                args.minimum_step,
+                args.zero_load_inj,
+                args.no_backtrack,
+            ),
+            cache,
+            ABORT_RULES,
+            topo_filter,
+            args.persistent_workers,
+        )
+        SaturationSearch.save_csv(points, args.output.absolute().with_name(
+            args.output.stem + "_saturation.csv"))
+    elif args.mode == "halving":
+        ranking = SuccessiveHalving.run(
+            args.exec_path.absolute(),
+            TASK_CONFIG,
+            configs_dir,
+            repo,
+            args.jobs,
+            HalvingParams(
+                args.eta,
+                args.min_sample_period,
+                args.halving_metric,
+            ),
+            cache,
+            ABORT_RULES,
+            topo_filter,
+            args.persistent_workers,
+        )
+        SuccessiveHalving.save_csv(ranking, args.output.absolute().with_name(
+            args.output.stem + "_halving.csv"))
+    elif args.mode == "worker":
+        Worker.run_many(
+            parse_address(args.address),
+            args.exec_path.absolute(),
+            configs_dir,
+            args.jobs,
+            cache=cache,
+            abort_rules=ABORT_RULES,
+        )
+    else:
+        journal_path = args.journal
+        if journal_path is None:
+            journal_path = args.output.with_name(
+                args.output.name + ".journal")
+        journal = SimJournal(journal_path.absolute(), args.resume)
+        cost_model = None
+        if args.schedule == "ljf":
+            cost_model = CostModel(args.history.absolute())
+        memory = None
+        if args.memory_budget is not None or args.memory_limit is not None:
+            memory = MemoryBudget(
+                MemoryModel(args.memory_history.absolute()),
+                args.memory_budget and args.memory_budget * 1024,
+                args.memory_limit and int(args.memory_limit * 1024))
+        surrogate = None
+        if args.surrogate:
+            surrogate = SurrogateFilter.from_results(
+                (args.surrogate_results or args.output).absolute(),
+                args.surrogate_uncertainty, args.surrogate_slack,
+                args.output.absolute().with_name(
+                    args.output.stem + "_surrogate.csv"))
+        run_args = (
+            args.exec_path.absolute(),
+            TASK_CONFIG,
+            configs_dir,
+            repo,
+            args.jobs,
+            cache,
+            journal,
+            ABORT_RULES,
+            cost_model,
+        )
+        stopping = None
+        if args.ci_target is not None:
+            stopping = StoppingRule(args.ci_metrics, args.ci_target,
+                                    args.max_replications)
+        metrics = None
+        metrics_server = None
+        if args.metrics_address is not None:
+            metrics = SweepMetrics()
+            metrics_server = MetricsServer(
+                parse_address(args.metrics_address), metrics)
+            metrics_server.start()
+        try:
+            if args.mode == "coordinator":
+                Coordinator.run(TASK_CONFIG, repo,
+                                parse_address(args.address),
+                                args.lease_timeout, journal, cost_model,
+                                args.dedup_isomorphic, topo_filter)
+            elif args.engine == "async":
+                AsyncMultiSimRunner.run(
+                    *run_args, timeout=args.timeout,
+                    dedup_isomorphic=args.dedup_isomorphic,
+                    topo_filter=topo_filter,
+                    details=args.details,
+                    metrics=metrics,
+                    memory=memory,
+                    surrogate=surrogate)
+            else:
+                MultiSimRunner.run(
+                    *run_args,
+                    dedup_isomorphic=args.dedup_isomorphic,
+                    topo_filter=topo_filter,
+                    persistent_workers=args.persistent_workers,
+                    replications=args.replications,
+                    stopping=stopping,
+                    details=args.details,
+                    metrics=metrics,
+                    memory=memory,
+                    surrogate=surrogate)
+        finally:
+            if metrics_server is not None:
+                metrics_server.stop()
+        if cost_model is not None:
+            cost_model.close()
+        if memory is not None:
+            memory.model.close()
+        if surrogate is not None:
+            surrogate.close()
+        journal.close()
 
     repo.close()
+    if args.export_csv is not None:
+        repo.export_csv(args.export_csv.absolute())
+    if args.export_columnar is not None:
+        if use_sqlite:
+            repo.export_columnar(args.export_columnar.absolute())
+        elif args.output.exists():
+            ColumnarResults.from_csv(args.output.absolute(),
+                                     args.export_columnar.absolute())
+    if not args.keep_configs:
+        shutil.rmtree(configs_dir, ignore_errors=True)
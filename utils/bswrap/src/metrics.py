@@ -0,0 +1,186 @@
+import time
+import http.server
+from threading import Thread, Lock
+from collections import Counter, deque
+from loguru import logger
+from model import Result, IResultRepo
+from journal import SimJournal
+
+
+class Histogram:
+    """
+    Cumulative histogram in the Prometheus sense. Not thread-safe.
+    """
+    def __init__(self, buckets: list[float]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name: str) -> list[str]:
+        lines = [f"# TYPE {name} histogram"]
+        for bound, count in zip(self.buckets, self.counts):
+            lines.append(f'{name}_bucket{{le="{bound:g}"}} {count}')
+        lines.append(f'{name}_bucket{{le="+Inf"}} {self.count}')
+        lines.append(f"{name}_sum {self.sum}")
+        lines.append(f"{name}_count {self.count}")
+        return lines
+
+
+class SweepMetrics:
+    """
+    Progress of a sweep in Prometheus text format. Runners report
+    queued, started, finished and skipped configs, the repository
+    wrapper reports write latencies. Rate and estimated time to
+    completion are taken over the last `window` seconds.
+    Has its own lock, so it never waits for the progress bar.
+    Thread-safe.
+    """
+    _JOB_BUCKETS = [0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600, 14400]
+    _WRITE_BUCKETS = [0.0001, 0.001, 0.01, 0.1, 1, 10]
+
+    def __init__(self, window: float = 300.0):
+        self._mx = Lock()
+        self._window = window
+        self._start = time.monotonic()
+        self._total = 0
+        self._queued = 0
+        self._started = 0
+        self._skipped = 0
+        self._outcomes: Counter = Counter()
+        self._finish_times: deque[float] = deque()
+        self._durations = Histogram(self._JOB_BUCKETS)
+        self._writes = Histogram(self._WRITE_BUCKETS)
+
+    def set_total(self, total: int) -> None:
+        with self._mx:
+            self._start = time.monotonic()
+            self._total = total
+
+    def queued(self) -> None:
+        with self._mx:
+            self._queued += 1
+
+    def started(self) -> None:
+        with self._mx:
+            self._started += 1
+
+    def skipped(self) -> None:
+        """
+        Config that is not simulated, e.g. finished before or filtered.
+        """
+        with self._mx:
+            self._skipped += 1
+
+    def finished(self, status: str, seconds: float) -> None:
+        """
+        Simulation ended with the SimJournal status.
+        """
+        now = time.monotonic()
+        with self._mx:
+            self._outcomes[status] += 1
+            self._durations.observe(seconds)
+            self._finish_times.append(now)
+
+    def written(self, seconds: float) -> None:
+        with self._mx:
+            self._writes.observe(seconds)
+
+    def _rate(self, now: float) -> float:
+        while self._finish_times and \
+                self._finish_times[0] < now - self._window:
+            self._finish_times.popleft()
+        span = min(self._window, now - self._start)
+        return len(self._finish_times) / span if span > 0 else 0.0
+
+    def render(self) -> str:
+        now = time.monotonic()
+        with self._mx:
+            finished = sum(self._outcomes.values())
+            active = self._started - finished
+            remaining = self._total - self._skipped - finished
+            rate = self._rate(now)
+            lines = [
+                "# TYPE bswrap_configs_total gauge",
+                f"bswrap_configs_total {self._total}",
+                "# TYPE bswrap_configs_skipped gauge",
+                f"bswrap_configs_skipped {self._skipped}",
+                "# TYPE bswrap_queue_depth gauge",
+                f"bswrap_queue_depth {max(self._queued - self._started, 0)}",
+                "# TYPE bswrap_active_jobs gauge",
+                f"bswrap_active_jobs {active}",
+                "# TYPE bswrap_jobs_finished_total counter",
+            ]
+            for status in (SimJournal.DONE, SimJournal.FAILED,
+                           SimJournal.ABORTED, SimJournal.TIMEOUT):
+                lines.append(f'bswrap_jobs_finished_total{{status="{status}"}}'
+                             f" {self._outcomes[status]}")
+            lines += [
+                "# TYPE bswrap_runs_per_second gauge",
+                f"bswrap_runs_per_second {rate}",
+                "# TYPE bswrap_eta_seconds gauge",
+                f"bswrap_eta_seconds {remaining / rate if rate > 0 else 'NaN'}",
+                "# TYPE bswrap_uptime_seconds gauge",
+                f"bswrap_uptime_seconds {now - self._start}",
+            ]
+            lines += self._durations.render("bswrap_job_duration_seconds")
+            lines += self._writes.render("bswrap_repo_write_seconds")
+        return "\n".join(lines) + "\n"
+
+
+class TimedRepo(IResultRepo):
+    """
+    Result repository reporting latency of every save to the metrics.
+    """
+    def __init__(self, repo: IResultRepo, metrics: SweepMetrics):
+        self._repo = repo
+        self._metrics = metrics
+
+    def save(self, obj: Result) -> None:
+        start = time.perf_counter()
+        self._repo.save(obj)
+        self._metrics.written(time.perf_counter() - start)
+
+
+class _MetricsHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = self.server.metrics.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MetricsServer(http.server.ThreadingHTTPServer):
+    """
+    Serves the metrics at /metrics from a background thread.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address: tuple[str, int], metrics: SweepMetrics):
+        super().__init__(address, _MetricsHandler)
+        self.metrics = metrics
+
+    def start(self) -> None:
+        Thread(target=self.serve_forever, daemon=True).start()
+        host, port = self.server_address[:2]
+        logger.info(f"Serving metrics on http://{host}:{port}/metrics.")
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
@@ -1,3 +1,6 @@
-from .models import Topology, Config, Result
+from .models import Topology, Config, Result, USAGE_FIELDS
+from .details import SimDetails
 from .iface import IResultRepo
 from .csv_repo import CSVResultRepo
+from .columnar import ColumnarResults
+from .sqlite_repo import SQLiteResultRepo
@@ -0,0 +1,144 @@
+import csv
+import json
+import shutil
+from pathlib import Path
+from collections.abc import Iterable, Sequence
+from dataclasses import fields
+import numpy as np
+from .models import Result
+
+
+class ColumnarResults:
+    """
+    Read-only columnar storage of results: a directory with one .npy
+    file per column, memory-mapped on open. Text columns are
+    dictionary-encoded, their .npy holds int32 codes and the
+    dictionary is kept in meta.json.
+    """
+    _META = "meta.json"
+    _CONFIG_TYPES = {
+        "topo_name": str,
+        "topo_num_nodes": int,
+        "topo_links": str,
+        "cfg_routing_func": str,
+        "cfg_traffic_type": str,
+        "cfg_sim_count": int,
+        "cfg_injection_rate": float,
+        "cfg_sample_period": int,
+        "cfg_seed": int,
+    }
+    # Optional statistics may be missing, they are float64 with NaN.
+    _TYPES = _CONFIG_TYPES | {
+        f.name: int if f.type is int else float
+        for f in fields(Result) if f.name not in ("config", "details")
+    }
+
+    def __init__(self, directory: Path):
+        self._dir = directory
+        with open(directory / self._META) as file:
+            meta = json.load(file)
+        self.num_rows: int = meta["num_rows"]
+        self.columns: list[str] = meta["columns"]
+        self._categories: dict[str, list[str]] = meta["categories"]
+        self._arrays: dict[str, np.ndarray] = {}
+
+    def __len__(self) -> int:
+        return self.num_rows
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        """
+        Returns the column, codes for text columns.
+        """
+        if name not in self._arrays:
+            if name not in self.columns:
+                raise KeyError(name)
+            self._arrays[name] = np.load(
+                self._dir / f"{name}.npy", mmap_mode="r")
+        return self._arrays[name]
+
+    def is_categorical(self, name: str) -> bool:
+        return name in self._categories
+
+    def categories(self, name: str) -> list[str]:
+        return self._categories[name]
+
+    def decode(self, name: str, codes: np.ndarray) -> list[str]:
+        categories = self._categories[name]
+        return [categories[code] for code in codes]
+
+    def equals(self, name: str, value) -> np.ndarray:
+        """
+        Boolean mask of rows where the column equals the value.
+        """
+        if self.is_categorical(name):
+            try:
+                value = self._categories[name].index(value)
+            except ValueError:
+                return np.zeros(self.num_rows, dtype=bool)
+        return self[name] == value
+
+    @classmethod
+    def write(cls, directory: Path, columns: Sequence[str],
+              rows: Iterable[Sequence]) -> "ColumnarResults":
+        """
+        Writes rows (value sequences ordered as columns) to the
+        directory, replacing its contents. Columns are typed by the
+        result schema: text columns are dictionary-encoded, integer
+        ones stored as int64, the rest, and integer ones with missing
+        values, as float64 with None or empty strings as NaN. Columns
+        unknown to the schema are text when any value is not a number.
+        """
+        values: list[list] = [[] for _ in columns]
+        for row in rows:
+            for column, value in zip(values, row):
+                column.append(value)
+
+        if directory.exists():
+            shutil.rmtree(directory)
+        directory.mkdir(parents=True)
+        categories: dict[str, list[str]] = {}
+        for name, column in zip(columns, values):
+            kind = cls._TYPES.get(name) or cls._guess_type(column)
+            if kind is str:
+                uniques, codes = np.unique(
+                    np.array(["" if v is None else str(v) for v in column],
+                             dtype=object),
+                    return_inverse=True)
+                categories[name] = uniques.tolist()
+                arr = codes.astype(np.int32)
+            elif kind is int and not any(v in (None, "") for v in column):
+                arr = np.array([int(float(v)) for v in column],
+                               dtype=np.int64)
+            else:
+                arr = np.array([np.nan if v in (None, "") else float(v)
+                                for v in column], dtype=np.float64)
+            np.save(directory / f"{name}.npy", arr)
+
+        with open(directory / cls._META, "w") as file:
+            json.dump({
+                "num_rows": len(values[0]) if values else 0,
+                "columns": list(columns),
+                "categories": categories,
+            }, file)
+        return cls(directory)
+
+    @staticmethod
+    def _guess_type(column: list) -> type:
+        for v in column:
+            if v in (None, ""):
+                continue
+            try:
+                float(v)
+            except (TypeError, ValueError):
+                return str
+        return float
+
+    @classmethod
+    def from_csv(cls, file: Path, directory: Path) -> "ColumnarResults":
+        """
+        Converts CSV written by CSVResultRepo.
+        """
+        with open(file, newline="") as f:
+            reader = csv.reader(f)
+            columns = next(reader)
+            return cls.write(directory, columns, reader)
@@ -1,14 +1,18 @@
 import csv
 from pathlib import Path
-from .models import Result
+from threading import Lock
+from loguru import logger
+from .models import Config, Result
 from .iface import IResultRepo
 
 
 class CSVResultRepo(IResultRepo):
     """
     CSV implementation of Result Repository.
-    Opens file on each save.
-    NOT THREAD-SAFE!
+    Appends to existing file without repeating the header. A file
+    written by an older version, with fewer columns, is rewritten
+    with the current header first, its rows mapped by column name.
+    Thread-safe.
     """
     _headers = [
         "topo_name",
@@ -17,6 +21,9 @@ class CSVResultRepo(IResultRepo):
         "cfg_routing_func",
         "cfg_traffic_type",
         "cfg_sim_count",
+        "cfg_injection_rate",
+        "cfg_sample_period",
+        "cfg_seed",
         "packet_latency_min",
         "packet_latency_max",
         "packet_latency_avg",
@@ -44,22 +51,84 @@ class CSVResultRepo(IResultRepo):
         "injected_packet_size_avg",
         "accepted_packet_size_avg",
         "hops_avg",
+        "topo_diameter",
+        "topo_avg_distance",
+        "replications",
+        "packet_latency_avg_ci",
+        "network_latency_avg_ci",
+        "flit_latency_avg_ci",
+        "accepted_packet_rate_avg_ci",
+        "accepted_flit_rate_avg_ci",
+        "hops_avg_ci",
+        "wall_time",
+        "cpu_user_time",
+        "cpu_sys_time",
+        "peak_rss_kb",
+        "config_time",
+        "parse_time",
     ]
+    # Config fields added after the first files were written, with
+    # the values their rows were simulated with.
+    _CONFIG_DEFAULTS = {
+        "cfg_injection_rate": Config.injection_rate,
+        "cfg_sample_period": Config.sample_period,
+        "cfg_seed": Config.seed,
+    }
 
     def __init__(self, file: Path):
         self._savefile = file
-        self._header_printed = False
+        self._header_printed = file.exists() and file.stat().st_size > 0
+        if self._header_printed:
+            self._migrate()
+        self._mx = Lock()
+        self._file = None
+        self._writer = None
+
+    def _migrate(self) -> None:
+        with open(self._savefile, newline="") as f:
+            reader = csv.DictReader(f)
+            columns = reader.fieldnames or []
+            if columns == self._headers:
+                return
+            unknown = set(columns) - set(self._headers)
+            if unknown:
+                raise ValueError(
+                    f"{self._savefile} has columns unknown to this "
+                    f"version: {', '.join(sorted(unknown))}. "
+                    "Use a new output file.")
+            rows = list(reader)
+        if any(None in row for row in rows):
+            raise ValueError(
+                f"{self._savefile} has rows longer than its header. "
+                "Use a new output file.")
+        logger.info(f"Rewriting {self._savefile} with "
+                    f"{len(self._headers) - len(columns)} new columns.")
+        tmp = self._savefile.with_name(self._savefile.name + ".tmp")
+        with open(tmp, "w", newline="") as f:
+            writer = csv.DictWriter(f, self._headers)
+            writer.writeheader()
+            for row in rows:
+                writer.writerow(self._CONFIG_DEFAULTS | row)
+        tmp.replace(self._savefile)
 
     def save(self, obj: Result) -> None:
         if not isinstance(obj, Result):
             raise ValueError("Supplied object must be "
                              "instance of Result class")
-        with open(self._savefile, "a") as file:
-            writer = csv.DictWriter(file, self._headers)
+        with self._mx:
+            if self._writer is None:
+                self._file = open(self._savefile, "a", newline="")
+                self._writer = csv.DictWriter(self._file, self._headers)
             if not self._header_printed:
                 self._header_printed = True
-                writer.writeheader()
-            writer.writerow(obj.to_dict())
+                self._writer.writeheader()
+            self._writer.writerow(obj.to_dict())
+            # Results are precious, keep the file complete after a crash.
+            self._file.flush()
 
     def close(self) -> None:
-        pass
+        with self._mx:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+                self._writer = None
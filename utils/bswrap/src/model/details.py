@@ -0,0 +1,80 @@
+import io
+from dataclasses import dataclass, field
+import numpy as np
+
+
+# Statistics of a 'results:' line of print_csv_results after the class,
+# traffic, use_read_write and load columns, in BookSim order.
+CLASS_STATS = [
+    "packet_latency_min", "packet_latency_avg", "packet_latency_max",
+    "network_latency_min", "network_latency_avg", "network_latency_max",
+    "flit_latency_min", "flit_latency_avg", "flit_latency_max",
+    "fragmentation_min", "fragmentation_avg", "fragmentation_max",
+    "injected_packet_rate_min", "injected_packet_rate_avg",
+    "injected_packet_rate_max",
+    "accepted_packet_rate_min", "accepted_packet_rate_avg",
+    "accepted_packet_rate_max",
+    "injected_flit_rate_min", "injected_flit_rate_avg",
+    "injected_flit_rate_max",
+    "accepted_flit_rate_min", "accepted_flit_rate_avg",
+    "accepted_flit_rate_max",
+    "injected_packet_size_avg", "accepted_packet_size_avg", "hops_avg",
+]
+# Histograms of stats_out, summed over the simulations of a run.
+HISTOGRAMS = ["plat_hist", "nlat_hist", "flat_hist", "frag_hist", "hops"]
+# Per-node rates of stats_out, averaged over the simulations of a run.
+NODE_RATES = ["sent_packets", "accepted_packets",
+              "sent_flits", "accepted_flits"]
+# Statistics printed after every sample period.
+SERIES = [
+    "packet_latency_avg", "network_latency_avg", "flit_latency_avg",
+    "injected_packet_rate_avg", "accepted_packet_rate_avg",
+    "injected_flit_rate_avg", "accepted_flit_rate_avg",
+]
+
+
+@dataclass
+class SimDetails:
+    """
+    Statistics of every traffic class besides the class 0 summary.
+    Row i of every array belongs to class classes[i]. class_stats
+    columns follow CLASS_STATS, series have a column per sample period
+    of all simulations of the run. Missing values are NaN, shorter
+    histograms are padded with zeros.
+    """
+    classes: np.ndarray
+    class_stats: np.ndarray
+    histograms: dict[str, np.ndarray] = field(default_factory=dict)
+    node_rates: dict[str, np.ndarray] = field(default_factory=dict)
+    series: dict[str, np.ndarray] = field(default_factory=dict)
+
+    def stat(self, cls: int, name: str) -> float:
+        row = np.flatnonzero(self.classes == cls)[0]
+        return float(self.class_stats[row, CLASS_STATS.index(name)])
+
+    def to_bytes(self) -> bytes:
+        """
+        Compressed npz archive of the arrays.
+        """
+        arrays = {"classes": self.classes, "class_stats": self.class_stats}
+        for prefix, group in (("hist_", self.histograms),
+                              ("node_", self.node_rates),
+                              ("series_", self.series)):
+            for name, values in group.items():
+                arrays[prefix + name] = values
+        buf = io.BytesIO()
+        np.savez_compressed(buf, **arrays)
+        return buf.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "SimDetails":
+        with np.load(io.BytesIO(data)) as arrays:
+            groups: dict[str, dict[str, np.ndarray]] = {
+                "hist_": {}, "node_": {}, "series_": {},
+            }
+            for key in arrays.files:
+                for prefix, group in groups.items():
+                    if key.startswith(prefix):
+                        group[key[len(prefix):]] = arrays[key]
+            return cls(arrays["classes"], arrays["class_stats"],
+                       groups["hist_"], groups["node_"], groups["series_"])
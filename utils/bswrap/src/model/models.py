@@ -1,4 +1,6 @@
-from dataclasses import dataclass
+import json
+from dataclasses import dataclass, fields
+from .details import SimDetails
 
 
 @dataclass
@@ -17,6 +19,14 @@ class Topology:
             "topo_links": self.links,
         }
 
+    @classmethod
+    def from_dict(cls, d: dict) -> "Topology":
+        return cls(
+            name=d["topo_name"],
+            num_nodes=d["topo_num_nodes"],
+            links=d["topo_links"],
+        )
+
 
 @dataclass
 class Config:
@@ -28,16 +38,51 @@ class Config:
     sim_count: int
 
     topo: Topology | None = None
+    injection_rate: float = 0.0001
+    sample_period: int = 10000
+    # Replications of the config run with consecutive seeds from it.
+    seed: int = 0
 
     def to_dict(self) -> dict:
         d = {
             "cfg_routing_func": self.routing_function,
             "cfg_traffic_type": self.traffic_type,
             "cfg_sim_count": self.sim_count,
+            "cfg_injection_rate": self.injection_rate,
+            "cfg_sample_period": self.sample_period,
+            "cfg_seed": self.seed,
         }
         d.update(self.topo.to_dict())
         return d
 
+    @classmethod
+    def from_dict(cls, d: dict) -> "Config":
+        return cls(
+            routing_function=d["cfg_routing_func"],
+            traffic_type=d["cfg_traffic_type"],
+            sim_count=d["cfg_sim_count"],
+            injection_rate=d["cfg_injection_rate"],
+            sample_period=d.get("cfg_sample_period", 10000),
+            seed=d.get("cfg_seed", 0),
+            topo=Topology.from_dict(d),
+        )
+
+    def key(self) -> str:
+        """
+        Stable string identifying the config.
+        """
+        return json.dumps(self.to_dict(), sort_keys=True)
+
+
+USAGE_FIELDS = [
+    "wall_time",
+    "cpu_user_time",
+    "cpu_sys_time",
+    "peak_rss_kb",
+    "config_time",
+    "parse_time",
+]
+
 
 @dataclass
 class Result:
@@ -73,9 +118,49 @@ class Result:
     hops_avg: float
 
     config: Config | None = None
+    # Analytical metrics of the topology, infinite when disconnected.
+    topo_diameter: float | None = None
+    topo_avg_distance: float | None = None
+    # Number of merged replications and 95% confidence interval
+    # half-widths of their means, None for a single simulation.
+    replications: int = 1
+    packet_latency_avg_ci: float | None = None
+    network_latency_avg_ci: float | None = None
+    flit_latency_avg_ci: float | None = None
+    accepted_packet_rate_avg_ci: float | None = None
+    accepted_flit_rate_avg_ci: float | None = None
+    hops_avg_ci: float | None = None
+    # Resources the simulation took: wall-clock, CPU, config generation
+    # and output parsing times in seconds, peak resident set size of
+    # BookSim in KiB. None when not measured, e.g. for cached results.
+    wall_time: float | None = None
+    cpu_user_time: float | None = None
+    cpu_sys_time: float | None = None
+    peak_rss_kb: int | None = None
+    config_time: float | None = None
+    parse_time: float | None = None
+    # Structured statistics of all traffic classes, when collected.
+    details: SimDetails | None = None
 
     def to_dict(self) -> dict:
+        """
+        Flat statistics and config, details are left out.
+        """
         d = self.__dict__.copy()
         d.pop("config")
+        d.pop("details")
         d.update(self.config.to_dict())
         return d
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "Result":
+        """
+        Inverse of to_dict. Config is restored only when present.
+        """
+        res = cls(**{
+            f.name: d[f.name] for f in fields(cls)
+            if f.name not in ("config", "details") and f.name in d
+        })
+        if "cfg_routing_func" in d:
+            res.config = Config.from_dict(d)
+        return res
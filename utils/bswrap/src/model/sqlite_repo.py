@@ -0,0 +1,254 @@
+import csv
+import queue
+import sqlite3
+from pathlib import Path
+from threading import Thread
+from collections.abc import Iterator
+from contextlib import closing
+from dataclasses import fields
+from loguru import logger
+from .models import Config, Result
+from .details import SimDetails
+from .iface import IResultRepo
+from .csv_repo import CSVResultRepo
+from .columnar import ColumnarResults
+
+
+class SQLiteResultRepo(IResultRepo):
+    """
+    SQLite implementation of Result Repository.
+    Results are inserted by a background writer thread in batches,
+    one transaction per batch. Config columns are indexed. Details
+    of results are kept as compressed blobs next to the statistics.
+    A batch that fails to insert is saved to a CSV file next to the
+    database, and the error is raised by the next save, flush or close,
+    so the sweep stops instead of journaling results that were lost.
+    Thread-safe.
+    """
+    _CONFIG_COLUMNS = {
+        "topo_name": "TEXT",
+        "topo_num_nodes": "INTEGER",
+        "topo_links": "TEXT",
+        "cfg_routing_func": "TEXT",
+        "cfg_traffic_type": "TEXT",
+        "cfg_sim_count": "INTEGER",
+        "cfg_injection_rate": "REAL",
+        "cfg_sample_period": "INTEGER",
+        "cfg_seed": "INTEGER",
+    }
+    # Config fields added after the first databases were written, with
+    # the values their rows were simulated with.
+    _CONFIG_DEFAULTS = {
+        "cfg_injection_rate": Config.injection_rate,
+        "cfg_sample_period": Config.sample_period,
+        "cfg_seed": Config.seed,
+    }
+    _BATCH_SIZE = 1000
+    _FLUSH_INTERVAL = 1.0
+
+    def __init__(self, file: Path):
+        self._file = file
+        self._result_columns = {
+            f.name: "INTEGER" if f.type in (int, int | None) else "REAL"
+            for f in fields(Result) if f.name not in ("config", "details")
+        }
+        self._columns = list(self._CONFIG_COLUMNS) + list(self._result_columns)
+        with closing(self._connect()) as conn:
+            self._create_schema(conn)
+        self._queue: queue.Queue[Result | None] = queue.Queue()
+        self._error: Exception | None = None
+        self._writer = Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self._file, timeout=60.0)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _create_schema(self, conn: sqlite3.Connection) -> None:
+        columns = [f"{name} {sql_type} NOT NULL"
+                   for name, sql_type in self._CONFIG_COLUMNS.items()]
+        columns += [f"{name} {sql_type}"
+                    for name, sql_type in self._result_columns.items()]
+        columns.append("details BLOB")
+        with conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS results "
+                         f"(id INTEGER PRIMARY KEY, {', '.join(columns)})")
+            # Databases written by older versions lack newer fields.
+            existing = {row[1] for row in
+                        conn.execute("PRAGMA table_info(results)")}
+            for name in self._columns:
+                if name not in existing:
+                    sql_type = (self._CONFIG_COLUMNS.get(name)
+                                or self._result_columns[name])
+                    default = self._CONFIG_DEFAULTS.get(name)
+                    if default is not None:
+                        sql_type += f" DEFAULT {default}"
+                    conn.execute(
+                        f"ALTER TABLE results ADD COLUMN {name} {sql_type}")
+            # Earlier migrations added config columns without defaults.
+            for name, default in self._CONFIG_DEFAULTS.items():
+                conn.execute(f"UPDATE results SET {name} = ? "
+                             f"WHERE {name} IS NULL", (default,))
+            if "details" not in existing:
+                conn.execute("ALTER TABLE results ADD COLUMN details BLOB")
+            conn.execute("CREATE INDEX IF NOT EXISTS results_config ON "
+                         f"results ({', '.join(self._CONFIG_COLUMNS)})")
+
+    def _select(self, names: list[str]) -> str:
+        """
+        Column list of a SELECT. Earlier migrations added integer
+        config columns as REAL, their values are cast back.
+        """
+        return ", ".join(
+            f"CAST({name} AS INTEGER) AS {name}"
+            if self._CONFIG_COLUMNS.get(name) == "INTEGER" else name
+            for name in names)
+
+    def _write_batch(self, conn: sqlite3.Connection,
+                     batch: list[Result]) -> None:
+        columns = self._columns + ["details"]
+        sql = (f"INSERT INTO results ({', '.join(columns)}) "
+               f"VALUES ({', '.join('?' * len(columns))})")
+        rows = []
+        for res in batch:
+            d = res.to_dict()
+            row = [d.get(name) for name in self._columns]
+            row.append(None if res.details is None
+                       else res.details.to_bytes())
+            rows.append(row)
+        with conn:
+            conn.executemany(sql, rows)
+
+    def _save_unsaved(self, batch: list[Result], error: Exception) -> None:
+        """
+        Keeps results of a failed batch in a CSV file next to the
+        database, the error is raised to the caller later.
+        """
+        self._error = error
+        unsaved = self._file.with_name(self._file.name + ".unsaved.csv")
+        logger.error(f"Failed to write {len(batch)} results: {error!r}, "
+                     f"saving them to {unsaved}")
+        repo = CSVResultRepo(unsaved)
+        try:
+            for res in batch:
+                repo.save(res)
+        finally:
+            repo.close()
+
+    def _write_loop(self) -> None:
+        conn = self._connect()
+        stop = False
+        while not stop:
+            try:
+                item = self._queue.get(timeout=self._FLUSH_INTERVAL)
+            except queue.Empty:
+                continue
+            batch: list[Result] = []
+            taken = 1
+            while True:
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+                if len(batch) >= self._BATCH_SIZE:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                    taken += 1
+                except queue.Empty:
+                    break
+            try:
+                if batch:
+                    self._write_batch(conn, batch)
+            except Exception as e:
+                self._save_unsaved(batch, e)
+            finally:
+                for _ in range(taken):
+                    self._queue.task_done()
+        conn.close()
+
+    def save(self, obj: Result) -> None:
+        if not isinstance(obj, Result):
+            raise ValueError("Supplied object must be "
+                             "instance of Result class")
+        if self._error is not None:
+            raise self._error
+        if not self._writer.is_alive():
+            raise RuntimeError("Repository is closed")
+        self._queue.put(obj)
+
+    def flush(self) -> None:
+        """
+        Blocks until every saved result is written.
+        Raises the error of a failed write.
+        """
+        self._queue.join()
+        if self._error is not None:
+            raise self._error
+
+    def contains(self, cfg: Config) -> bool:
+        """
+        Checks whether the config has at least one saved result.
+        """
+        self.flush()
+        d = cfg.to_dict()
+        where = " AND ".join(f"{name} = ?" for name in self._CONFIG_COLUMNS)
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                f"SELECT 1 FROM results WHERE {where} LIMIT 1",
+                [d[name] for name in self._CONFIG_COLUMNS],
+            ).fetchone()
+        return row is not None
+
+    def results(self, **filters) -> Iterator[Result]:
+        """
+        Yields saved results with their details in insertion order.
+        Keyword arguments filter by column value, e.g.
+        topo_name="circulant".
+        """
+        unknown = set(filters) - set(self._columns)
+        if unknown:
+            raise ValueError(f"Unknown columns: {', '.join(unknown)}")
+        self.flush()
+        sql = f"SELECT {self._select(self._columns)}, details FROM results"
+        if filters:
+            sql += " WHERE " + " AND ".join(f"{name} = ?" for name in filters)
+        with closing(self._connect()) as conn:
+            for row in conn.execute(sql + " ORDER BY id",
+                                    list(filters.values())):
+                res = Result.from_dict(dict(zip(self._columns, row)))
+                if row[-1] is not None:
+                    res.details = SimDetails.from_bytes(row[-1])
+                yield res
+
+    def export_csv(self, file: Path) -> None:
+        """
+        Writes all saved results to a CSV file in CSVResultRepo format.
+        """
+        self.flush()
+        headers = CSVResultRepo._headers
+        with closing(self._connect()) as conn, \
+                open(file, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(headers)
+            writer.writerows(conn.execute(
+                f"SELECT {self._select(headers)} FROM results ORDER BY id"))
+
+    def export_columnar(self, directory: Path) -> ColumnarResults:
+        """
+        Writes all saved results to memory-mappable columnar storage.
+        """
+        self.flush()
+        sql = f"SELECT {self._select(self._columns)} FROM results ORDER BY id"
+        with closing(self._connect()) as conn:
+            return ColumnarResults.write(
+                directory, self._columns, conn.execute(sql))
+
+    def close(self) -> None:
+        if self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join()
+        if self._error is not None:
+            raise self._error
@@ -0,0 +1,169 @@
+import math
+from pathlib import Path
+from dataclasses import dataclass, field, fields, replace, MISSING
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from loguru import logger
+from model import Config, Result, USAGE_FIELDS
+from simulator import SimRunner
+
+
+# Two-sided 95% quantiles of Student's t distribution by degrees of
+# freedom, the normal quantile is used for larger samples.
+_T95 = [12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262,
+        2.228, 2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101,
+        2.093, 2.086, 2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052,
+        2.048, 2.045, 2.042]
+_Z95 = 1.960
+
+# Statistics BookSim reports, the fields merged between replications.
+STAT_FIELDS = [f.name for f in fields(Result) if f.default is MISSING]
+# Averages over packets are weighted by the number of packets each
+# replication delivered, which is proportional to its accepted rate.
+# Rates are averages over nodes and cycles and are not weighted.
+_WEIGHTS = {
+    "flit_latency_avg": "accepted_flit_rate_avg",
+    "injected_packet_size_avg": "injected_packet_rate_avg",
+}
+_DEFAULT_WEIGHT = "accepted_packet_rate_avg"
+# Metrics that get confidence interval fields in the merged Result.
+SPREAD_METRICS = [
+    "packet_latency_avg",
+    "network_latency_avg",
+    "flit_latency_avg",
+    "accepted_packet_rate_avg",
+    "accepted_flit_rate_avg",
+    "hops_avg",
+]
+
+
+def confidence_interval(values: np.ndarray) -> float | None:
+    """
+    Half-width of the 95% confidence interval of the mean of
+    independent samples, None for less than two samples.
+    """
+    n = len(values)
+    if n < 2:
+        return None
+    t = _T95[n - 2] if n - 1 <= len(_T95) else _Z95
+    return float(t * np.std(values, ddof=1) / math.sqrt(n))
+
+
+def _merge_stat(name: str, values: np.ndarray,
+                results: list[Result]) -> float:
+    if name.endswith("_min"):
+        return float(values.min())
+    if name.endswith("_max"):
+        return float(values.max())
+    if "_rate_" in name:
+        return float(values.mean())
+    weights = np.array([getattr(res, _WEIGHTS.get(name, _DEFAULT_WEIGHT))
+                        for res in results])
+    if weights.sum() <= 0:
+        return float(values.mean())
+    return float(np.average(values, weights=weights))
+
+
+def merge_results(results: list[Result]) -> Result:
+    """
+    Merges results of independent replications of one config: min
+    and max are global, averages over packets are weighted by packet
+    counts, rates are averaged. Spread of SPREAD_METRICS between the
+    replications is given as confidence intervals. Resource usage is
+    the total of the replications, peak RSS the highest one. Config
+    is not set.
+    """
+    merged = {}
+    for name in STAT_FIELDS:
+        values = np.array([getattr(res, name) for res in results])
+        merged[name] = _merge_stat(name, values, results)
+    for name in SPREAD_METRICS:
+        merged[name + "_ci"] = confidence_interval(
+            np.array([getattr(res, name) for res in results]))
+    for name in USAGE_FIELDS:
+        values = [getattr(res, name) for res in results]
+        if None not in values:
+            merged[name] = max(values) if name == "peak_rss_kb" \
+                else sum(values)
+    return Result(**merged, replications=len(results))
+
+
+@dataclass
+class StoppingRule:
+    """
+    Replications of a config go on until the 95% confidence interval
+    half-width of every metric is within `target` of its mean, or
+    max_replications are done.
+    """
+    metrics: list[str] = field(
+        default_factory=lambda: ["packet_latency_avg"])
+    target: float = 0.05
+    max_replications: int = 10
+
+    def satisfied(self, results: list[Result]) -> bool:
+        for name in self.metrics:
+            values = np.array([getattr(res, name) for res in results])
+            ci = confidence_interval(values)
+            if ci is None or ci > self.target * abs(values.mean()):
+                return False
+        return True
+
+
+class ReplicatedSimRunner:
+    """
+    Splits every config into independent replications with
+    consecutive seeds, sim_count divided between them, and runs them
+    in parallel, so one long simulation uses several cores.
+    With the stopping rule, further waves of as many replications
+    are run while the confidence intervals are too wide.
+    Replications of all configs share one pool of `jobs` threads.
+    Thread-safe.
+    """
+    def __init__(self, simulator: SimRunner, replications: int, jobs: int,
+                 stopping: StoppingRule | None = None):
+        self._simulator = simulator
+        self._replications = replications
+        self._stopping = stopping
+        self._pool = ThreadPoolExecutor(max_workers=jobs)
+
+    def replicas(self, config: Config, start: int = 0,
+                 count: int | None = None) -> list[Config]:
+        """
+        Replications start..start+count-1, a wave by default.
+        """
+        if count is None:
+            count = self._replications
+        sim_count = math.ceil(config.sim_count / self._replications)
+        return [replace(config, seed=config.seed + i, sim_count=sim_count)
+                for i in range(start, start + count)]
+
+    def _run_wave(self, replicas: list[Config],
+                  configs_dir: Path) -> list[Result]:
+        futures = [self._pool.submit(self._simulator.sim, replica, configs_dir)
+                   for replica in replicas]
+        try:
+            return [fut.result() for fut in futures]
+        finally:
+            for fut in futures:
+                fut.cancel()
+
+    def sim(self, config: Config, configs_dir: Path) -> Result:
+        """
+        Returns merged result. Raises the error of the first failed
+        replication, the rest are cancelled.
+        """
+        results = self._run_wave(self.replicas(config), configs_dir)
+        stopping = self._stopping
+        if stopping is not None:
+            while (len(results) < stopping.max_replications
+                   and not stopping.satisfied(results)):
+                count = min(self._replications,
+                            stopping.max_replications - len(results))
+                results += self._run_wave(
+                    self.replicas(config, len(results), count), configs_dir)
+            logger.info(f"{len(results)} replications of config {config}")
+        return SimRunner._attach_config(merge_results(results), config)
+
+    def close(self) -> None:
+        self._pool.shutdown(cancel_futures=True)
+        self._simulator.close()
@@ -1,10 +1,34 @@
+import time
+from math import prod
 from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import (
+    ThreadPoolExecutor,
+    Future,
+    wait,
+    FIRST_COMPLETED,
+)
 from threading import Lock
-from dataclasses import dataclass
+from dataclasses import dataclass, field, replace
 from itertools import product
+from collections.abc import Iterator
 from model import Topology, Config, Result, IResultRepo
-from simulator import SimRunner, BadSimSummary, SimSummaryNotFound
+from simulator import (
+    SimRunner,
+    BadSimSummary,
+    SimSummaryNotFound,
+    SimAborted,
+)
+from sim_output import AbortRule
+from batch_runner import BatchSimRunner
+from replication import ReplicatedSimRunner, StoppingRule
+from cache import ResultCache
+from scheduler import CostModel, MemoryBudget
+from journal import SimJournal
+from isomorphism import canonical_config
+from topology_filter import TopologyFilter
+from surrogate import SurrogateFilter
+from usage import UsageReport
+from metrics import SweepMetrics, TimedRepo
 from loguru import logger
 from tqdm import tqdm
 
@@ -13,6 +37,7 @@ from tqdm import tqdm
 class ProgressBarSync:
     bar: tqdm
     mx: Lock
+    metrics: SweepMetrics | None = None
 
 
 @dataclass
@@ -24,13 +49,102 @@ class SimulationTask:
     routing_funcs: list[str]
     traffic_types: list[str]
     sim_counts: list[int]
+    injection_rates: list[float] = field(default_factory=lambda: [0.0001])
+
+    def __len__(self) -> int:
+        """
+        Number of configs the task expands to.
+        """
+        return prod(map(len, (
+            self.topo_names, self.num_nodes, self.links,
+            self.routing_funcs, self.traffic_types, self.sim_counts,
+            self.injection_rates,
+        )))
+
+
+class TopologyDedup:
+    """
+    Passes one config of every class of configs differing only in
+    isomorphic circulant topology to simulation and records its
+    outcome for every config of the class.
+    Thread-safe.
+    """
+    def __init__(self, repo: IResultRepo, journal: SimJournal | None):
+        self._repo = repo
+        self._journal = journal
+        self._mx = Lock()
+        # Class key -> configs waiting for the simulated one.
+        self._aliases: dict[str, list[Config]] = {}
+        self._outcomes: dict[str, tuple[str, Result | None]] = {}
+        self._class_keys: dict[str, str] = {}
+        self.duplicates = 0
+
+    def _record_alias(self, cfg: Config, status: str,
+                      res: Result | None) -> None:
+        if res is not None:
+            self._repo.save(replace(res, config=cfg))
+        if self._journal is not None:
+            self._journal.record(cfg, status)
+
+    def unique(self, configs: Iterator[Config],
+               sync_bar: ProgressBarSync) -> Iterator[Config]:
+        """
+        Yields the first config of every class, outcomes of the rest
+        are recorded when the first one is recorded.
+        """
+        for cfg in configs:
+            try:
+                key = canonical_config(cfg).key()
+            except ValueError:
+                # Invalid links, let the simulation report it.
+                yield cfg
+                continue
+            with self._mx:
+                if key not in self._aliases:
+                    self._aliases[key] = []
+                    self._class_keys[cfg.key()] = key
+                    new_class = True
+                else:
+                    new_class = False
+                    self.duplicates += 1
+                    outcome = self._outcomes.get(key)
+                    if outcome is None:
+                        self._aliases[key].append(cfg)
+                    else:
+                        self._record_alias(cfg, *outcome)
+            if new_class:
+                yield cfg
+            else:
+                MultiSimRunner._update_bar(sync_bar)
+        logger.info(f"Skipped {self.duplicates} configs "
+                    "with isomorphic topologies.")
+
+    def record(self, cfg: Config, status: str, res: Result | None) -> None:
+        """
+        Records outcome of a simulated config and of its class.
+        """
+        if res is not None:
+            self._repo.save(res)
+        if self._journal is not None:
+            self._journal.record(cfg, status)
+        with self._mx:
+            key = self._class_keys.pop(cfg.key(), None)
+            if key is None:
+                return
+            self._outcomes[key] = (status, res)
+            aliases = self._aliases[key]
+            self._aliases[key] = []
+            for alias in aliases:
+                self._record_alias(alias, status, res)
 
 
 class MultiSimRunner:
-    @staticmethod
-    def _generate_configs(tasks: list[SimulationTask]) -> list[Config]:
-        res: list[Config] = []
+    # Submission queue holds this many configs per job, so that
+    # workers never starve while the config space stays lazy.
+    _QUEUE_FACTOR = 2
 
+    @staticmethod
+    def _generate_configs(tasks: list[SimulationTask]) -> Iterator[Config]:
         for task in tasks:
             topos: list[Topology] = []
 
@@ -42,19 +156,72 @@ class MultiSimRunner:
                 ))
             
             for args in product(topos, task.routing_funcs,
-                                task.traffic_types, task.sim_counts):
-                res.append(Config(
+                                task.traffic_types, task.sim_counts,
+                                task.injection_rates):
+                yield Config(
                     topo=args[0],
                     routing_function=args[1],
                     traffic_type=args[2],
                     sim_count=args[3],
-                ))
+                    injection_rate=args[4],
+                )
 
-        return res
+    @staticmethod
+    def _update_bar(sync_bar: ProgressBarSync) -> None:
+        """
+        Counts a config that is not simulated.
+        """
+        with sync_bar.mx:
+            sync_bar.bar.update()
+        if sync_bar.metrics is not None:
+            sync_bar.metrics.skipped()
+
+    @staticmethod
+    def _skip_finished(configs: Iterator[Config], journal: SimJournal,
+                       sync_bar: ProgressBarSync) -> Iterator[Config]:
+        skipped = 0
+        for cfg in configs:
+            if journal.is_finished(cfg):
+                skipped += 1
+                MultiSimRunner._update_bar(sync_bar)
+                continue
+            yield cfg
+        logger.info(f"Skipped {skipped} configs found in the journal.")
+
+    @staticmethod
+    def _prepare_configs(tasks: list[SimulationTask], jobs: int,
+                         journal: SimJournal | None,
+                         cost_model: CostModel | None,
+                         sync_bar: ProgressBarSync,
+                         dedup: TopologyDedup | None = None,
+                         topo_filter: TopologyFilter | None = None,
+                         surrogate: SurrogateFilter | None = None
+                         ) -> Iterator[Config]:
+        """
+        Returns configs to simulate, lazily generated or, with the cost
+        model, ordered from the most expensive one.
+        """
+        configs = MultiSimRunner._generate_configs(tasks)
+        if journal is not None:
+            configs = MultiSimRunner._skip_finished(configs, journal, sync_bar)
+        if topo_filter is not None:
+            configs = topo_filter.select(
+                configs, lambda _: MultiSimRunner._update_bar(sync_bar))
+        if surrogate is not None:
+            configs = surrogate.select(
+                configs, lambda _: MultiSimRunner._update_bar(sync_bar))
+        if dedup is not None:
+            configs = dedup.unique(configs, sync_bar)
+        if cost_model is not None:
+            configs = iter(cost_model.order(configs, jobs))
+        return configs
 
     @staticmethod
     def _worker(cfg: Config, simulator: SimRunner, cfgs_dir: Path,
-                sync_bar: ProgressBarSync) -> Result | None:
+                sync_bar: ProgressBarSync) -> tuple[str, Result | None]:
+        """
+        Returns simulation outcome (SimJournal status) and result.
+        """
         with sync_bar.mx:
             sync_bar.bar.set_description(
                 f"Processing '{cfg.topo.name}_N{cfg.topo.num_nodes}_"
@@ -62,38 +229,140 @@ class MultiSimRunner:
             )
             sync_bar.bar.update()
 
+        metrics = sync_bar.metrics
+        if metrics is None:
+            return MultiSimRunner._simulate(cfg, simulator, cfgs_dir)
+        metrics.started()
+        start = time.monotonic()
+        status, res = MultiSimRunner._simulate(cfg, simulator, cfgs_dir)
+        metrics.finished(status, time.monotonic() - start)
+        return status, res
+
+    @staticmethod
+    def _simulate(cfg: Config, simulator: SimRunner,
+                  cfgs_dir: Path) -> tuple[str, Result | None]:
+        """
+        Returns simulation outcome (SimJournal status) and result.
+        """
         try:
-            return simulator.sim(cfg, cfgs_dir)
+            return SimJournal.DONE, simulator.sim(cfg, cfgs_dir)
+        except SimAborted as e:
+            logger.info(f"Aborted config {cfg}: {e}")
+            return SimJournal.ABORTED, None
         except (BadSimSummary, SimSummaryNotFound):
             logger.warning(f"Error occured on config {cfg}")
         except ValueError:
             logger.warning(f"Error on circulant config: {cfg.topo}")
 
-        return None
+        return SimJournal.FAILED, None
+
+    @staticmethod
+    def _record(cfg: Config, status: str, res: Result | None,
+                repo: IResultRepo, journal: SimJournal | None,
+                dedup: TopologyDedup | None,
+                usage: UsageReport | None = None) -> None:
+        if usage is not None and res is not None:
+            usage.add(res)
+        if dedup is not None:
+            dedup.record(cfg, status, res)
+            return
+        if res is not None:
+            repo.save(res)
+        if journal is not None:
+            journal.record(cfg, status)
+
+    @staticmethod
+    def _collect(futures: dict[Future, Config], done: set[Future],
+                 repo: IResultRepo, journal: SimJournal | None,
+                 dedup: TopologyDedup | None, usage: UsageReport) -> None:
+        for fut in done:
+            cfg = futures.pop(fut)
+            status, res = fut.result()
+            MultiSimRunner._record(
+                cfg, status, res, repo, journal, dedup, usage)
 
     @staticmethod
     def run(simulator_path: Path, tasks: list[SimulationTask],
-            configs_dir: Path, repo: IResultRepo, jobs: int):
-        logger.info("Preparing configurations.")
-        configs = MultiSimRunner._generate_configs(tasks)
+            configs_dir: Path, repo: IResultRepo, jobs: int,
+            cache: ResultCache | None = None,
+            journal: SimJournal | None = None,
+            abort_rules: list[AbortRule] | None = None,
+            cost_model: CostModel | None = None,
+            dedup_isomorphic: bool = False,
+            topo_filter: TopologyFilter | None = None,
+            persistent_workers: bool = False,
+            replications: int = 1,
+            stopping: StoppingRule | None = None,
+            details: bool = False,
+            metrics: SweepMetrics | None = None,
+            memory: MemoryBudget | None = None,
+            surrogate: SurrogateFilter | None = None):
+        """
+        Runs simulations for all configs of the tasks. Configs are
+        generated lazily and results are saved in completion order.
+        With the cost model, the most expensive configs go first.
+        With dedup_isomorphic, configs with isomorphic circulants
+        are simulated once. Configs rejected by the topology filter
+        are not simulated. With persistent_workers, simulations are fed
+        to long-lived BookSim processes in batch mode. With several
+        replications, every config is split into seeded replications
+        run in parallel and their results are merged. With the stopping
+        rule, replications go on until their results are precise enough.
+        With details, structured statistics of all traffic classes are
+        attached to the results. Resource usage of the simulations is
+        saved with the results and the most expensive configs are
+        logged at the end. Progress is reported to the metrics. With the
+        memory budget, simulations start only while their estimated
+        memory fits into it. With the surrogate, only configs it is
+        unsure about or predicts competitive are simulated.
+        """
+        total = sum(map(len, tasks))
+        if metrics is not None:
+            metrics.set_total(total)
+            repo = TimedRepo(repo, metrics)
+        sync_bar = ProgressBarSync(tqdm(total=total), Lock(), metrics)
+        dedup = TopologyDedup(repo, journal) if dedup_isomorphic else None
+        configs = MultiSimRunner._prepare_configs(
+            tasks, jobs, journal, cost_model, sync_bar, dedup, topo_filter,
+            surrogate)
 
         logger.info("Starting simulations.")
-        sync_bar = ProgressBarSync(tqdm(total=len(configs)), Lock())
-        simulator = SimRunner(simulator_path)
-
-        with ThreadPoolExecutor(max_workers=jobs) as pool:
-            results = pool.map(
-                lambda cfg: MultiSimRunner._worker(
-                    cfg,
-                    simulator,
-                    configs_dir,
-                    sync_bar),
-                configs
-            )
+        simulator_cls = BatchSimRunner if persistent_workers else SimRunner
+        simulator = simulator_cls(
+            simulator_path, cache, abort_rules, cost_model, details, memory)
+        if replications > 1 or stopping is not None:
+            simulator = ReplicatedSimRunner(
+                simulator, replications, jobs, stopping)
+        max_pending = jobs * MultiSimRunner._QUEUE_FACTOR
+        futures: dict[Future, Config] = {}
+        usage = UsageReport()
+
+        pool = ThreadPoolExecutor(max_workers=jobs)
+        try:
+            for cfg in configs:
+                if len(futures) >= max_pending:
+                    done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                    MultiSimRunner._collect(
+                        futures, done, repo, journal, dedup, usage)
+                fut = pool.submit(MultiSimRunner._worker, cfg, simulator,
+                                  configs_dir, sync_bar)
+                futures[fut] = cfg
+                if metrics is not None:
+                    metrics.queued()
 
-            for res in results:
-                if res is not None:
-                    repo.save(res)
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                MultiSimRunner._collect(
+                    futures, done, repo, journal, dedup, usage)
+        except KeyboardInterrupt:
+            logger.error("Interrupted, finished simulations are saved. "
+                         "Run with --resume to continue.")
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
+        finally:
+            pool.shutdown()
+            simulator.close()
+            sync_bar.bar.close()
 
-        sync_bar.bar.close()
+        usage.log()
         logger.info("Done.")
@@ -0,0 +1,180 @@
+import csv
+from pathlib import Path
+from threading import Lock
+from dataclasses import dataclass, replace
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from loguru import logger
+from tqdm import tqdm
+from model import Config, IResultRepo
+from simulator import (
+    SimRunner,
+    BadSimSummary,
+    SimSummaryNotFound,
+    SimAborted,
+)
+from sim_output import AbortRule
+from batch_runner import BatchSimRunner
+from runner import MultiSimRunner, SimulationTask
+from cache import ResultCache
+from topology_filter import TopologyFilter
+
+
+@dataclass
+class SaturationParams:
+    """
+    Search parameters, same meaning as in utils/sweep.sh.
+    """
+    initial_step: float = 0.05
+    minimum_step: float = 0.001
+    zero_load_inj: float = 0.0025
+    no_backtrack: bool = False
+
+
+@dataclass
+class SaturationPoint:
+    """
+    Outcome of saturation search for one config.
+    Rates are None when even the zero-load simulation failed.
+    """
+    config: Config
+    zero_load_latency: float | None
+    saturation_rate: float | None
+
+    def to_dict(self) -> dict:
+        d = self.config.to_dict()
+        d.pop("cfg_injection_rate")
+        d["zero_load_latency"] = self.zero_load_latency
+        d["saturation_rate"] = self.saturation_rate
+        return d
+
+
+class SaturationSearch:
+    """
+    Step-halving search of saturation injection rate, a port of
+    utils/sweep.sh. Probes of one config are sequential, searches
+    for different configs run concurrently. Every successful probe
+    is saved to the result repository.
+    """
+    # Injection rates are rounded so that accumulated steps give
+    # stable config names and cache keys.
+    _RATE_DIGITS = 9
+
+    def __init__(self, simulator: SimRunner, configs_dir: Path,
+                 repo: IResultRepo, params: SaturationParams):
+        self._simulator = simulator
+        self._configs_dir = configs_dir
+        self._repo = repo
+        self._repo_mx = Lock()
+        self._params = params
+
+    def _probe(self, cfg: Config, injection_rate: float) -> float | None:
+        """
+        Returns packet latency at the injection rate, None when the
+        simulation is unstable.
+        """
+        probe_cfg = replace(
+            cfg, injection_rate=round(injection_rate, self._RATE_DIGITS))
+        try:
+            res = self._simulator.sim(probe_cfg, self._configs_dir)
+        except (BadSimSummary, SimSummaryNotFound, SimAborted):
+            return None
+        with self._repo_mx:
+            self._repo.save(res)
+        return res.packet_latency_avg
+
+    def search(self, cfg: Config) -> SaturationPoint:
+        params = self._params
+        zero_load_lat = self._probe(cfg, params.zero_load_inj)
+        if zero_load_lat is None:
+            logger.warning(f"Zero-load simulation failed for {cfg}")
+            return SaturationPoint(cfg, None, None)
+
+        step = params.initial_step
+        old_inj = 0.0
+        inj = step
+        last_fail = 1.0 + params.minimum_step
+        while True:
+            lat = None
+            if inj < last_fail:
+                lat = self._probe(cfg, inj)
+            if lat is None:
+                if params.no_backtrack:
+                    break
+                step /= 2
+                if step < params.minimum_step:
+                    break
+                last_fail = inj
+                inj = old_inj + step
+                continue
+            old_inj = inj
+            inj += step
+
+        return SaturationPoint(
+            cfg, zero_load_lat, round(old_inj, self._RATE_DIGITS))
+
+    @staticmethod
+    def _unique_configs(tasks: list[SimulationTask]) -> list[Config]:
+        """
+        Configs of the tasks with injection rate dimension dropped.
+        """
+        res: dict[str, Config] = {}
+        for cfg in MultiSimRunner._generate_configs(tasks):
+            key = (cfg.topo.name, cfg.topo.num_nodes, cfg.topo.links,
+                   cfg.routing_function, cfg.traffic_type, cfg.sim_count,
+                   cfg.sample_period, cfg.seed)
+            res.setdefault(key, cfg)
+        return list(res.values())
+
+    @staticmethod
+    def run(simulator_path: Path, tasks: list[SimulationTask],
+            configs_dir: Path, repo: IResultRepo, jobs: int,
+            params: SaturationParams,
+            cache: ResultCache | None = None,
+            abort_rules: list[AbortRule] | None = None,
+            topo_filter: TopologyFilter | None = None,
+            persistent_workers: bool = False
+            ) -> list[SaturationPoint]:
+        configs = SaturationSearch._unique_configs(tasks)
+        if topo_filter is not None:
+            configs = list(topo_filter.select(iter(configs), lambda _: None))
+        simulator_cls = BatchSimRunner if persistent_workers else SimRunner
+        simulator = simulator_cls(simulator_path, cache, abort_rules)
+        search = SaturationSearch(
+            simulator, configs_dir, repo, params)
+        res: list[SaturationPoint] = []
+
+        logger.info(f"Searching saturation rate of {len(configs)} configs.")
+        bar = tqdm(total=len(configs))
+        pool = ThreadPoolExecutor(max_workers=jobs)
+        try:
+            futures = [pool.submit(search.search, cfg) for cfg in configs]
+            for fut in as_completed(futures):
+                try:
+                    point = fut.result()
+                except ValueError as e:
+                    logger.warning(f"Error on circulant config: {e}")
+                    continue
+                logger.info(f"Saturation rate {point.saturation_rate} "
+                            f"for {point.config}")
+                res.append(point)
+                bar.update()
+        except KeyboardInterrupt:
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
+        finally:
+            pool.shutdown()
+            simulator.close()
+            bar.close()
+
+        logger.info("Done.")
+        return res
+
+    @staticmethod
+    def save_csv(points: list[SaturationPoint], file: Path) -> None:
+        if not points:
+            return
+        with open(file, "w") as f:
+            writer = csv.DictWriter(f, points[0].to_dict().keys())
+            writer.writeheader()
+            for point in points:
+                writer.writerow(point.to_dict())
@@ -0,0 +1,278 @@
+import json
+import math
+import heapq
+import resource
+from pathlib import Path
+from threading import Lock, Condition
+from contextlib import contextmanager
+from collections.abc import Iterable, Iterator
+from loguru import logger
+from model import Config
+from configs import get_topology_size
+
+
+class CostModel:
+    """
+    Estimates simulation runtime of configs.
+    Static estimate is proportional to network size times number of
+    simulations. Observed runtimes calibrate it into seconds, configs
+    seen before are estimated by their own mean runtime.
+    Observations are appended to the history file, so estimates
+    improve from sweep to sweep.
+    Thread-safe.
+    """
+    def __init__(self, history_file: Path | None = None):
+        self._mx = Lock()
+        # Config key -> (total seconds, number of runs)
+        self._observed: dict[str, tuple[float, int]] = {}
+        # Sums for least squares fit of seconds = scale * cost.
+        self._sum_cost_time = 0.0
+        self._sum_cost_sq = 0.0
+        self._file = None
+        if history_file is not None:
+            if history_file.exists():
+                self._load(history_file)
+            self._file = open(history_file, "a")
+
+    @staticmethod
+    def _static_cost(cfg_dict: dict) -> float:
+        routers, links = get_topology_size(
+            cfg_dict["topo_name"],
+            cfg_dict["topo_num_nodes"],
+            cfg_dict["topo_links"],
+        )
+        # Each link is a pair of channels with their own buffers.
+        return (cfg_dict["cfg_sim_count"]
+                * cfg_dict.get("cfg_sample_period", 10000) / 10000
+                * (routers + 2 * links))
+
+    def _add(self, cfg_dict: dict, seconds: float) -> None:
+        key = json.dumps(cfg_dict, sort_keys=True)
+        total, count = self._observed.get(key, (0.0, 0))
+        self._observed[key] = (total + seconds, count + 1)
+        cost = self._static_cost(cfg_dict)
+        self._sum_cost_time += cost * seconds
+        self._sum_cost_sq += cost * cost
+
+    def _load(self, file: Path) -> None:
+        with open(file) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    self._add(entry["config"], entry["seconds"])
+                except (ValueError, KeyError):
+                    logger.warning(f"Skipping damaged history line: {line!r}")
+
+    def is_calibrated(self) -> bool:
+        return self._sum_cost_sq > 0
+
+    def observe(self, cfg: Config, seconds: float) -> None:
+        cfg_dict = cfg.to_dict()
+        with self._mx:
+            self._add(cfg_dict, seconds)
+            if self._file is not None:
+                self._file.write(json.dumps(
+                    {"config": cfg_dict, "seconds": seconds}) + "\n")
+                self._file.flush()
+
+    def estimate(self, cfg: Config) -> float:
+        """
+        Returns estimated runtime, in seconds when the model is
+        calibrated, in arbitrary units otherwise.
+        """
+        with self._mx:
+            observed = self._observed.get(cfg.key())
+            if observed is not None:
+                return observed[0] / observed[1]
+            scale = 1.0
+            if self.is_calibrated():
+                scale = self._sum_cost_time / self._sum_cost_sq
+        return scale * self._static_cost(cfg.to_dict())
+
+    @staticmethod
+    def predict_makespan(estimates: list[float], jobs: int) -> float:
+        """
+        Makespan of greedy list scheduling of jobs in the given order.
+        """
+        loads = [0.0] * jobs
+        for estimate in estimates:
+            heapq.heappush(loads, heapq.heappop(loads) + estimate)
+        return max(loads)
+
+    def order(self, configs: Iterable[Config], jobs: int) -> list[Config]:
+        """
+        Returns configs sorted from the most expensive to the cheapest
+        (longest job first) and reports predicted makespan.
+        """
+        estimated = sorted(((self.estimate(cfg), cfg) for cfg in configs),
+                           key=lambda x: x[0], reverse=True)
+        estimates = [estimate for estimate, _ in estimated]
+        makespan = self.predict_makespan(estimates, jobs)
+        units = "s" if self.is_calibrated() else "cost units"
+        logger.info(f"Predicted makespan {makespan:.1f} {units} "
+                    f"for {len(estimated)} configs on {jobs} jobs, "
+                    f"total work {sum(estimates):.1f} {units}.")
+        return [cfg for _, cfg in estimated]
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+
+
+class MemoryModel:
+    """
+    Estimates peak resident set size of configs in KiB.
+    Memory grows linearly with network size, routers plus channels.
+    Measured peaks fit intercept and slope by least squares once two
+    network sizes are seen, configs seen before are estimated by
+    their own largest peak. Estimates carry a safety margin.
+    Observations are appended to the history file, so estimates
+    improve from sweep to sweep.
+    Thread-safe.
+    """
+    # Used until calibrated, above what 4 VCs of 4 flits take.
+    _DEFAULT_BASE_KB = 16 * 1024
+    _DEFAULT_SLOPE_KB = 32.0
+    _MARGIN = 1.25
+
+    def __init__(self, history_file: Path | None = None):
+        self._mx = Lock()
+        # Config key -> largest observed peak.
+        self._observed: dict[str, int] = {}
+        # Sums for least squares fit of kb = base + slope * size.
+        self._n = 0
+        self._sum_size = 0.0
+        self._sum_kb = 0.0
+        self._sum_size_sq = 0.0
+        self._sum_size_kb = 0.0
+        self._sizes: set[float] = set()
+        self._file = None
+        if history_file is not None:
+            if history_file.exists():
+                self._load(history_file)
+            self._file = open(history_file, "a")
+
+    @staticmethod
+    def _size(cfg_dict: dict) -> float:
+        routers, links = get_topology_size(
+            cfg_dict["topo_name"],
+            cfg_dict["topo_num_nodes"],
+            cfg_dict["topo_links"],
+        )
+        return routers + 2 * links
+
+    def _add(self, cfg_dict: dict, peak_kb: int) -> None:
+        key = json.dumps(cfg_dict, sort_keys=True)
+        self._observed[key] = max(self._observed.get(key, 0), peak_kb)
+        size = self._size(cfg_dict)
+        self._n += 1
+        self._sum_size += size
+        self._sum_kb += peak_kb
+        self._sum_size_sq += size * size
+        self._sum_size_kb += size * peak_kb
+        self._sizes.add(size)
+
+    def _load(self, file: Path) -> None:
+        with open(file) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    self._add(entry["config"], entry["peak_rss_kb"])
+                except (ValueError, KeyError):
+                    logger.warning(f"Skipping damaged history line: {line!r}")
+
+    def _fit(self) -> tuple[float, float]:
+        if len(self._sizes) < 2:
+            return self._DEFAULT_BASE_KB, self._DEFAULT_SLOPE_KB
+        n = self._n
+        slope = ((n * self._sum_size_kb - self._sum_size * self._sum_kb)
+                 / (n * self._sum_size_sq - self._sum_size ** 2))
+        slope = max(slope, 0.0)
+        return (self._sum_kb - slope * self._sum_size) / n, slope
+
+    def observe(self, cfg: Config, peak_kb: int) -> None:
+        cfg_dict = cfg.to_dict()
+        with self._mx:
+            self._add(cfg_dict, peak_kb)
+            if self._file is not None:
+                self._file.write(json.dumps(
+                    {"config": cfg_dict, "peak_rss_kb": peak_kb}) + "\n")
+                self._file.flush()
+
+    def estimate(self, cfg: Config) -> float:
+        with self._mx:
+            observed = self._observed.get(cfg.key())
+            if observed is not None:
+                return observed * self._MARGIN
+            base, slope = self._fit()
+        return (base + slope * self._size(cfg.to_dict())) * self._MARGIN
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+
+
+class MemoryBudget:
+    """
+    Admission control of simulations by estimated memory. Simulations
+    are admitted in arrival order while the estimates of the running
+    ones fit into `budget_kb`, without it all are admitted at once.
+    A simulation larger than the budget is admitted alone.
+    With `process_limit_kb`, every BookSim process
+    gets RLIMIT_AS, so a runaway one fails instead of the OOM killer
+    taking the sweep down.
+    Thread-safe.
+    """
+    def __init__(self, model: MemoryModel, budget_kb: float | None = None,
+                 process_limit_kb: int | None = None):
+        self.model = model
+        self._budget = math.inf if budget_kb is None else budget_kb
+        self._process_limit = process_limit_kb
+        self._cv = Condition()
+        self._used = 0.0
+        self._running = 0
+        # Tickets of waiting simulations, admitted in order.
+        self._next_ticket = 0
+        self._serving = 0
+
+    def acquire(self, cfg: Config) -> float:
+        """
+        Blocks until the config fits, returns its reserved estimate.
+        """
+        kb = self.model.estimate(cfg)
+        with self._cv:
+            ticket = self._next_ticket
+            self._next_ticket += 1
+            self._cv.wait_for(lambda: ticket == self._serving and (
+                self._running == 0 or self._used + kb <= self._budget))
+            self._serving += 1
+            self._used += kb
+            self._running += 1
+            self._cv.notify_all()
+        return kb
+
+    def release(self, kb: float) -> None:
+        with self._cv:
+            self._used -= kb
+            self._running -= 1
+            self._cv.notify_all()
+
+    @contextmanager
+    def reserve(self, cfg: Config) -> Iterator[None]:
+        kb = self.acquire(cfg)
+        try:
+            yield
+        finally:
+            self.release(kb)
+
+    def limit(self, pid: int) -> None:
+        """
+        Applies the address space limit to the started process.
+        """
+        if self._process_limit is None:
+            return
+        limit = self._process_limit * 1024
+        try:
+            resource.prlimit(pid, resource.RLIMIT_AS, (limit, limit))
+        except (ProcessLookupError, PermissionError):
+            pass
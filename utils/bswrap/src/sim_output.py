@@ -0,0 +1,396 @@
+import re
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, fields, MISSING
+import numpy as np
+from model import Result, SimDetails
+from model.details import CLASS_STATS, HISTOGRAMS, NODE_RATES, SERIES
+
+
+class BadSimSummary(Exception):
+    pass
+
+
+class SimSummaryNotFound(Exception):
+    pass
+
+
+class SimAborted(Exception):
+    pass
+
+
+@dataclass
+class SamplePeriod:
+    """
+    Statistics of traffic class 0 printed after each sample period.
+    """
+    packet_latency_avg: float
+    injected_packet_rate_avg: float
+    accepted_packet_rate_avg: float
+
+
+class AbortRule(ABC):
+    """
+    Rule deciding whether a running simulation is worth finishing.
+    """
+    @abstractmethod
+    def check(self, periods: list[SamplePeriod]) -> str | None:
+        """
+        Returns the reason to abort the simulation, None to go on.
+        `periods` holds every sample period of the current run so far.
+        """
+        pass
+
+
+@dataclass
+class LatencyGrowthRule(AbortRule):
+    """
+    Aborts when packet latency grows by more than `min_growth`
+    (relative) in each of `periods` consecutive sample periods.
+    """
+    periods: int = 3
+    min_growth: float = 0.05
+
+    def check(self, periods: list[SamplePeriod]) -> str | None:
+        if len(periods) <= self.periods:
+            return None
+        tail = periods[-self.periods - 1:]
+        for prev, cur in zip(tail, tail[1:]):
+            if (cur.packet_latency_avg
+                    <= prev.packet_latency_avg * (1 + self.min_growth)):
+                return None
+        return (f"packet latency grew for {self.periods} "
+                "sample periods in a row")
+
+
+@dataclass
+class LatencyLimitRule(AbortRule):
+    """
+    Aborts when packet latency exceeds `limit` cycles.
+    """
+    limit: float
+
+    def check(self, periods: list[SamplePeriod]) -> str | None:
+        if periods and periods[-1].packet_latency_avg > self.limit:
+            return f"packet latency exceeded {self.limit} cycles"
+        return None
+
+
+@dataclass
+class AcceptanceRule(AbortRule):
+    """
+    Aborts when accepted packet rate stays below `min_ratio` of
+    injected packet rate for `periods` sample periods in a row,
+    i.e. the network can not keep up with the offered load.
+    """
+    min_ratio: float = 0.9
+    periods: int = 2
+
+    def check(self, periods: list[SamplePeriod]) -> str | None:
+        if len(periods) < self.periods:
+            return None
+        for period in periods[-self.periods:]:
+            if (period.accepted_packet_rate_avg
+                    >= period.injected_packet_rate_avg * self.min_ratio):
+                return None
+        return (f"accepted rate below {self.min_ratio} of injected rate "
+                f"for {self.periods} sample periods")
+
+
+class SimOutputParser:
+    """
+    Incremental parser of BookSim standard output.
+    Lines are fed as the simulator prints them. Sample period
+    statistics are checked against abort rules, overall statistics
+    of traffic class 0 make up the Result.
+    """
+    _PERIOD_START = "Class 0:"
+    # Either next class block or convergence check follows class 0 stats.
+    _PERIOD_END = ("Class ", "latency change")
+    # 'Class 0:' also heads the in-flight flit listing printed while
+    # the network drains, it holds no statistics.
+    _DRAIN = ("Remaining flits", "Draining")
+    _SIM_END = "Time taken is"
+    _SUMMARY_START = "====== Traffic class 0 ======"
+    _SUMMARY_END = ("======", "Total run time")
+    _USAGE = re.compile(r"Resource usage: user (\S+) s, system (\S+) s, "
+                        r"peak RSS (\d+) kB")
+    _RESULT_FIELDS = [f.name for f in fields(Result) if f.default is MISSING]
+
+    def __init__(self, abort_rules: list[AbortRule] | None = None):
+        self._rules = abort_rules or []
+        self._periods: list[SamplePeriod] = []
+        self._period: dict[str, float] | None = None
+        self._summary: dict[str, float] | None = None
+        self._summary_done = False
+        self._prefix = ""
+        # Seconds spent in feed_timed.
+        self.parse_time = 0.0
+        # User and system CPU seconds and peak RSS in KiB of the run,
+        # as BookSim reports them.
+        self.usage: tuple[float, float, int] | None = None
+
+    @staticmethod
+    def _split(line: str) -> tuple[str, float]:
+        """
+        Splits 'Packet latency average = 14.9 (1 samples)' into
+        stat name and value.
+        """
+        name, value = line.split("=", 1)
+        return name.strip(), float(value.split()[0])
+
+    def _feed_stat(self, line: str, stats: dict[str, float]) -> None:
+        name, value = self._split(line)
+        if name == "minimum":
+            stats[self._prefix + "_min"] = value
+        elif name == "maximum":
+            stats[self._prefix + "_max"] = value
+        elif name.endswith("average"):
+            self._prefix = name[:-len("average")].strip() \
+                .lower().replace(" ", "_")
+            stats[self._prefix + "_avg"] = value
+
+    def _end_period(self) -> str | None:
+        try:
+            self._periods.append(SamplePeriod(
+                packet_latency_avg=self._period["packet_latency_avg"],
+                injected_packet_rate_avg=
+                    self._period["injected_packet_rate_avg"],
+                accepted_packet_rate_avg=
+                    self._period["accepted_packet_rate_avg"],
+            ))
+        except KeyError:
+            return None
+        finally:
+            self._period = None
+        for rule in self._rules:
+            reason = rule.check(self._periods)
+            if reason is not None:
+                return reason
+        return None
+
+    def feed(self, line: str) -> None:
+        """
+        Consumes one line of output.
+        Raises SimAborted when an abort rule fires.
+        """
+        line = line.rstrip("\n")
+        if self._summary is not None and not self._summary_done:
+            if line.startswith(self._SUMMARY_END):
+                self._summary_done = True
+            elif "=" in line:
+                try:
+                    self._feed_stat(line, self._summary)
+                except ValueError:
+                    raise BadSimSummary(line)
+        elif line.startswith(self._SIM_END):
+            self._period = None
+            self._periods.clear()
+        elif line == self._SUMMARY_START:
+            self._period = None
+            self._summary = {}
+        elif self._period is not None:
+            if line.startswith(self._DRAIN):
+                self._period = None
+            elif line.startswith(self._PERIOD_END):
+                reason = self._end_period()
+                if reason is not None:
+                    raise SimAborted(reason)
+            elif "=" in line:
+                try:
+                    self._feed_stat(line, self._period)
+                except ValueError:
+                    pass
+        elif line == self._PERIOD_START:
+            self._period = {}
+        elif line.startswith("Resource usage:"):
+            match = self._USAGE.match(line)
+            if match is not None:
+                self.usage = (float(match[1]), float(match[2]),
+                              int(match[3]))
+
+    def feed_timed(self, line: str) -> None:
+        """
+        feed, adding the time it takes to parse_time.
+        """
+        start = time.perf_counter()
+        try:
+            self.feed(line)
+        finally:
+            self.parse_time += time.perf_counter() - start
+
+    def result(self) -> Result:
+        """
+        Returns Result built from the overall statistics.
+        """
+        if self._summary is None:
+            raise SimSummaryNotFound()
+        try:
+            return Result(**{
+                name: self._summary[name] for name in self._RESULT_FIELDS
+            })
+        except KeyError as e:
+            raise BadSimSummary(f"Missing {e} in summary")
+
+
+class DetailedSimOutputParser(SimOutputParser):
+    """
+    SimOutputParser that also collects SimDetails of every traffic
+    class in the same pass: overall statistics of 'results:' lines,
+    histograms and per-node rates of stats_out statements and the
+    statistics printed after every sample period. BookSim must run
+    with ARGS, so that everything arrives on standard output. Result
+    is taken from the 'results:' line of class 0 when present.
+    """
+    ARGS = ["print_csv_results=1", "stats_out=-"]
+    _CSV_PREFIX = "results:"
+    _CLASS_RE = re.compile(r"Class (\d+):$")
+    _CLASS_END = ("Total in-flight flits", "latency change")
+    # MATLAB statements of stats_out, e.g. 'plat_hist(1,:) = [ 0 3 ];'
+    _MATLAB_RE = re.compile(r"(\w+)\((\d+)(?:,:)?\) = \[?([^\]]*)\]?;$")
+
+    def __init__(self, abort_rules: list[AbortRule] | None = None):
+        super().__init__(abort_rules)
+        self._class_stats: dict[int, list[float]] = {}
+        self._histograms: dict[str, dict[int, np.ndarray]] = {
+            name: {} for name in HISTOGRAMS}
+        # Sums of per-node rates and the number of simulations summed.
+        self._node_rates: dict[str, dict[int, tuple[np.ndarray, int]]] = {
+            name: {} for name in NODE_RATES}
+        self._series: dict[int, list[dict[str, float]]] = {}
+        self._series_period: dict[str, float] | None = None
+        self._series_class = 0
+        self._series_prefix = ""
+
+    @staticmethod
+    def _split_traffic(text: str) -> tuple[str, str]:
+        """
+        Splits off the traffic pattern column, whose arguments may hold
+        commas inside {} or (), e.g. 'hotspot({0,1},{4,1})'.
+        """
+        depth = 0
+        for i, char in enumerate(text):
+            if char in "{(":
+                depth += 1
+            elif char in "})":
+                depth -= 1
+            elif char == "," and depth == 0:
+                return text[:i], text[i + 1:]
+        return text, ""
+
+    def _feed_csv(self, line: str) -> None:
+        # class,traffic,use_read_write,load and the statistics, builds
+        # with TRACK_STALLS append stall rates after them.
+        cls, _, rest = line[len(self._CSV_PREFIX):].partition(",")
+        _, rest = self._split_traffic(rest)
+        values = rest.split(",")[2:2 + len(CLASS_STATS)]
+        if len(values) != len(CLASS_STATS):
+            raise BadSimSummary(line)
+        try:
+            self._class_stats[int(cls)] = list(map(float, values))
+        except ValueError:
+            raise BadSimSummary(line)
+
+    def _feed_matlab(self, name: str, cls: str, body: str) -> None:
+        # Matlab classes are numbered from 1.
+        cls = int(cls) - 1
+        if name in self._histograms:
+            hist = np.array(body.split(), dtype=np.int64)
+            prev = self._histograms[name].get(cls)
+            if prev is not None:
+                size = max(len(prev), len(hist))
+                hist = (np.pad(prev, (0, size - len(prev)))
+                        + np.pad(hist, (0, size - len(hist))))
+            self._histograms[name][cls] = hist
+        elif name in self._node_rates:
+            rates = np.array(body.split(), dtype=np.float64)
+            prev = self._node_rates[name].get(cls)
+            if prev is not None and len(prev[0]) == len(rates):
+                rates, count = prev[0] + rates, prev[1] + 1
+            else:
+                count = 1
+            self._node_rates[name][cls] = (rates, count)
+
+    def _feed_series(self, line: str) -> None:
+        """
+        Periods are kept when they end with statistics, 'Class N:'
+        blocks of the drain phase are dropped.
+        """
+        match = self._CLASS_RE.match(line)
+        if match is not None:
+            self._series_period = {}
+            self._series_class = int(match.group(1))
+        elif self._series_period is not None:
+            if line.startswith(self._CLASS_END):
+                if self._series_period:
+                    self._series.setdefault(self._series_class, []).append(
+                        self._series_period)
+                self._series_period = None
+                return
+            if line.startswith(self._DRAIN + (self._SIM_END, "======")):
+                self._series_period = None
+                return
+            try:
+                name, value = self._split(line)
+            except ValueError:
+                return
+            if name.endswith("average"):
+                self._series_prefix = name[:-len("average")].strip() \
+                    .lower().replace(" ", "_")
+                self._series_period[self._series_prefix + "_avg"] = value
+
+    def feed(self, line: str) -> None:
+        stripped = line.rstrip("\n")
+        if stripped.startswith(self._CSV_PREFIX):
+            self._feed_csv(stripped)
+            return
+        match = self._MATLAB_RE.match(stripped)
+        if match is not None:
+            self._feed_matlab(*match.groups())
+            return
+        self._feed_series(stripped)
+        super().feed(line)
+
+    def result(self) -> Result:
+        stats = self._class_stats.get(0)
+        if stats is None:
+            return super().result()
+        d = dict(zip(CLASS_STATS, stats))
+        return Result(**{name: d[name] for name in self._RESULT_FIELDS})
+
+    @staticmethod
+    def _padded(rows: list[np.ndarray], fill, dtype) -> np.ndarray:
+        width = max((len(row) for row in rows), default=0)
+        res = np.full((len(rows), width), fill, dtype=dtype)
+        for i, row in enumerate(rows):
+            res[i, :len(row)] = row
+        return res
+
+    def details(self) -> SimDetails:
+        classes = sorted(set(self._class_stats) | set(self._series)
+                         | {cls for group in self._histograms.values()
+                            for cls in group})
+        class_stats = np.full((len(classes), len(CLASS_STATS)), np.nan)
+        for i, cls in enumerate(classes):
+            if cls in self._class_stats:
+                class_stats[i] = self._class_stats[cls]
+        histograms = {
+            name: self._padded([group.get(cls, np.zeros(0, np.int64))
+                                for cls in classes], 0, np.int64)
+            for name, group in self._histograms.items() if group
+        }
+        node_rates = {
+            name: self._padded([
+                group[cls][0] / group[cls][1] if cls in group
+                else np.zeros(0) for cls in classes], np.nan, np.float64)
+            for name, group in self._node_rates.items() if group
+        }
+        series = {
+            name: self._padded([
+                np.array([period.get(name, np.nan)
+                          for period in self._series.get(cls, [])])
+                for cls in classes], np.nan, np.float64)
+            for name in SERIES
+        } if self._series else {}
+        return SimDetails(np.array(classes, dtype=np.int64), class_stats,
+                          histograms, node_rates, series)
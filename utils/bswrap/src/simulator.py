@@ -1,8 +1,19 @@
-import re
-import io
+import time
 import subprocess as sp
 from pathlib import Path
+from contextlib import AbstractContextManager, nullcontext
 from model import Config, Result
+from cache import ResultCache
+from scheduler import CostModel, MemoryBudget
+from topology_filter import topology_metrics
+from sim_output import (
+    SimOutputParser,
+    DetailedSimOutputParser,
+    AbortRule,
+    BadSimSummary,
+    SimSummaryNotFound,
+    SimAborted,
+)
 from configs import (
     ISimConfig,
     CirculantConfig,
@@ -11,11 +22,7 @@ from configs import (
 )
 
 
-class BadSimSummary(Exception):
-    pass
-
-
-class SimSummaryNotFound(Exception):
+class SimTimeout(Exception):
     pass
 
 
@@ -25,53 +32,30 @@ class SimRunner:
         "mesh": new_mesh_config,
         "torus": new_torus_config,
     }
-    _FEATURE_RE = re.compile(r"\.*= ([+-]?\d+(\.\d+(e[+-]?\d+)?)?)")
 
-    def __init__(self, booksim_exec: Path):
+    def __init__(self, booksim_exec: Path, cache: ResultCache | None = None,
+                 abort_rules: list[AbortRule] | None = None,
+                 cost_model: CostModel | None = None,
+                 details: bool = False,
+                 memory: MemoryBudget | None = None):
         self._exec = booksim_exec.absolute()
-    
-    def _get_float_from_line(self, line: str) -> float:
-        return float(self._FEATURE_RE.search(line)[1])
-    
-    def _parse_simulator_output(self, stream: io.StringIO) -> Result:
-        line = stream.readline()
-        while line != "" and line != "====== Traffic class 0 ======\n":
-            line = stream.readline()
-        if line == "":
-            raise SimSummaryNotFound()
-        
-        try:
-            return Result(
-                packet_latency_min=self._get_float_from_line(stream.readline()),
-                packet_latency_max=self._get_float_from_line(stream.readline()),
-                packet_latency_avg=self._get_float_from_line(stream.readline()),
-                network_latency_min=self._get_float_from_line(stream.readline()),
-                network_latency_max=self._get_float_from_line(stream.readline()),
-                network_latency_avg=self._get_float_from_line(stream.readline()),
-                flit_latency_min=self._get_float_from_line(stream.readline()),
-                flit_latency_max=self._get_float_from_line(stream.readline()),
-                flit_latency_avg=self._get_float_from_line(stream.readline()),
-                fragmentation_min=self._get_float_from_line(stream.readline()),
-                fragmentation_max=self._get_float_from_line(stream.readline()),
-                fragmentation_avg=self._get_float_from_line(stream.readline()),
-                injected_packet_rate_min=self._get_float_from_line(stream.readline()),
-                injected_packet_rate_max=self._get_float_from_line(stream.readline()),
-                injected_packet_rate_avg=self._get_float_from_line(stream.readline()),
-                accepted_packet_rate_min=self._get_float_from_line(stream.readline()),
-                accepted_packet_rate_max=self._get_float_from_line(stream.readline()),
-                accepted_packet_rate_avg=self._get_float_from_line(stream.readline()),
-                injected_flit_rate_min=self._get_float_from_line(stream.readline()),
-                injected_flit_rate_max=self._get_float_from_line(stream.readline()),
-                injected_flit_rate_avg=self._get_float_from_line(stream.readline()),
-                accepted_flit_rate_min=self._get_float_from_line(stream.readline()),
-                accepted_flit_rate_max=self._get_float_from_line(stream.readline()),
-                accepted_flit_rate_avg=self._get_float_from_line(stream.readline()),
-                injected_packet_size_avg=self._get_float_from_line(stream.readline()),
-                accepted_packet_size_avg=self._get_float_from_line(stream.readline()),
-                hops_avg=self._get_float_from_line(stream.readline()),
-            )
-        except ValueError:
-            raise BadSimSummary()
+        self._cache = cache
+        self._abort_rules = abort_rules or []
+        self._cost_model = cost_model
+        self._details = details
+        self._memory = memory
+
+    def _new_parser(self) -> SimOutputParser:
+        if self._details:
+            return DetailedSimOutputParser(self._abort_rules)
+        return SimOutputParser(self._abort_rules)
+
+    def _create_args(self, sim_config: ISimConfig,
+                     configs_dir: Path) -> list[str]:
+        args = sim_config.create_config(configs_dir.absolute())
+        if self._details:
+            args += DetailedSimOutputParser.ARGS
+        return args
 
     def _get_simulator_config(self, config: Config) -> ISimConfig:
         return self._CONFIG_CONSTRUCTORS[config.topo.name](
@@ -80,17 +64,107 @@ class SimRunner:
             config.routing_function,
             config.traffic_type,
             config.sim_count,
+            config.injection_rate,
+            config.sample_period,
+            config.seed,
         )
 
+    def _get_command(self, args: list[str]) -> list[str]:
+        return [str(self._exec)] + args
+
+    def _lookup_cache(self, sim_config: ISimConfig
+                      ) -> tuple[str | None, Result | None]:
+        """
+        Returns cache key and cached result, if any.
+        """
+        if self._cache is None:
+            return None, None
+        cache_key = self._cache.key(sim_config)
+        res = self._cache.get(cache_key)
+        if res is not None and self._details and res.details is None:
+            # Cached without details, simulate again to collect them.
+            return cache_key, None
+        return cache_key, res
+
+    @staticmethod
+    def _attach_config(res: Result, config: Config) -> Result:
+        res.config = config
+        metrics = topology_metrics(config.topo)
+        if metrics is not None:
+            res.topo_diameter = metrics.diameter
+            res.topo_avg_distance = metrics.avg_distance
+        return res
+
+    def _finish(self, config: Config, parser: SimOutputParser,
+                cache_key: str | None, elapsed: float,
+                config_time: float) -> Result:
+        res = parser.result()
+        if self._details:
+            res.details = parser.details()
+        if cache_key is not None:
+            self._cache.put(cache_key, res)
+        if self._cost_model is not None:
+            self._cost_model.observe(config, elapsed)
+        res.wall_time = elapsed
+        res.config_time = config_time
+        res.parse_time = parser.parse_time
+        if parser.usage is not None:
+            res.cpu_user_time, res.cpu_sys_time, res.peak_rss_kb = \
+                parser.usage
+            if self._memory is not None:
+                self._memory.model.observe(config, res.peak_rss_kb)
+        return self._attach_config(res, config)
+
+    def _reserve(self, config: Config) -> AbstractContextManager:
+        """
+        Waits until the memory budget admits the config.
+        """
+        if self._memory is None:
+            return nullcontext()
+        return self._memory.reserve(config)
+
+    def _limit(self, pid: int) -> None:
+        if self._memory is not None:
+            self._memory.limit(pid)
+
     def sim(self, config: Config, configs_dir: Path) -> Result:
         sim_config = self._get_simulator_config(config)
-        config_path = sim_config.create_config(configs_dir.absolute())
-        sim_output = sp.run(
-            f"{self._exec} {config_path} 2>&1",
-            shell=True,
-            capture_output=True,
-        )
-        res = self._parse_simulator_output(
-            io.StringIO(sim_output.stdout.decode()))
-        res.config = config
+        cache_key, res = self._lookup_cache(sim_config)
+        if res is not None:
+            return self._attach_config(res, config)
+
+        start = time.perf_counter()
+        args = self._create_args(sim_config, configs_dir)
+        config_time = time.perf_counter() - start
+        parser = self._new_parser()
+        with self._reserve(config):
+            start = time.monotonic()
+            self._run_simulator(args, parser)
+
+        res = self._finish(config, parser, cache_key,
+                           time.monotonic() - start, config_time)
         return res
+
+    def _run_simulator(self, args: list[str], parser: SimOutputParser) -> None:
+        """
+        Runs BookSim with the arguments, feeding its output to the parser.
+        """
+        with sp.Popen(
+            self._get_command(args),
+            stdout=sp.PIPE,
+            stderr=sp.STDOUT,
+            text=True,
+        ) as proc:
+            self._limit(proc.pid)
+            try:
+                for line in proc.stdout:
+                    parser.feed_timed(line)
+            finally:
+                if proc.poll() is None:
+                    proc.kill()
+
+    def close(self) -> None:
+        """
+        Releases simulator processes kept by the runner.
+        """
+        pass
@@ -0,0 +1,311 @@
+import csv
+import math
+from pathlib import Path
+from dataclasses import dataclass
+from collections.abc import Iterable, Iterator, Callable
+import numpy as np
+from loguru import logger
+from model import Topology, Config, SQLiteResultRepo
+from configs import get_topology_size
+from topology_filter import topology_metrics
+
+
+def _avg_distance(name: str, num_nodes: int, links: str) -> float:
+    """
+    Average shortest path, exact for circulants and approximate for
+    tori and meshes. Infinite for disconnected or invalid circulants.
+    """
+    if name == "circulant":
+        metrics = topology_metrics(Topology(name, num_nodes, links))
+        return math.inf if metrics is None else metrics.avg_distance
+    k, n = map(int, links.split(",")[:2])
+    if name == "torus":
+        return n * k / 4
+    return n * (k * k - 1) / (3 * k)
+
+
+def _features(d: dict) -> list[float] | None:
+    """
+    Numeric features of a flat config. None when the topology has no
+    finite distance metrics.
+    """
+    name, links = d["topo_name"], d["topo_links"]
+    num_nodes = d["topo_num_nodes"]
+    distance = _avg_distance(name, num_nodes, links)
+    if not math.isfinite(distance):
+        return None
+    routers, channels = get_topology_size(name, num_nodes, links)
+    degree = 2 * channels / routers
+    rate = d["cfg_injection_rate"]
+    # Channel load of uniform traffic, latency grows with it
+    # towards saturation.
+    load = rate * distance / degree
+    return [math.log(num_nodes), degree, distance, rate,
+            load, load ** 2, load ** 3]
+
+
+def _group(d: dict) -> tuple:
+    """
+    Configs differing only in topology links compete with each other.
+    """
+    return (d["topo_name"], d["topo_num_nodes"],
+            d["cfg_routing_func"], d["cfg_traffic_type"],
+            d["cfg_sim_count"], d["cfg_injection_rate"],
+            d["cfg_sample_period"], d["cfg_seed"])
+
+
+# Config fields missing from stores written by older versions, or
+# NULL in their rows, take the defaults those versions ran with.
+_CONFIG_DEFAULTS = {
+    "cfg_injection_rate": (float, Config.injection_rate),
+    "cfg_sample_period": (int, Config.sample_period),
+    "cfg_seed": (int, Config.seed),
+}
+_REQUIRED = {
+    "topo_name": str,
+    "topo_num_nodes": int,
+    "topo_links": str,
+    "cfg_routing_func": str,
+    "cfg_traffic_type": str,
+    "cfg_sim_count": int,
+    "packet_latency_avg": float,
+    "hops_avg": float,
+}
+
+
+def _clean(d: dict) -> dict | None:
+    """
+    Typed training row of a flat result, None when it can not be used.
+    """
+    try:
+        row = {name: cast(d[name]) for name, cast in _REQUIRED.items()}
+        for name, (cast, default) in _CONFIG_DEFAULTS.items():
+            value = d.get(name)
+            row[name] = cast(default if value in (None, "") else value)
+        if _features(row) is None:
+            return None
+    except (KeyError, TypeError, ValueError, IndexError):
+        return None
+    return row
+
+
+def load_results(file: Path) -> list[dict]:
+    """
+    Typed training rows of a SQLite or CSV result store, empty when
+    it does not exist. Rows that can not be used are skipped.
+    """
+    if not file.exists():
+        logger.warning(f"Surrogate results {file} do not exist.")
+        return []
+    if file.suffix in (".db", ".sqlite"):
+        repo = SQLiteResultRepo(file)
+        try:
+            raw = [res.to_dict() for res in repo.results()]
+        finally:
+            repo.close()
+    else:
+        with open(file, newline="") as f:
+            raw = list(csv.DictReader(f))
+    rows = [row for row in map(_clean, raw) if row is not None]
+    if len(rows) < len(raw):
+        logger.warning(f"Surrogate skipped {len(raw) - len(rows)} of "
+                       f"{len(raw)} results of {file} without usable "
+                       "config, latency or hops.")
+    return rows
+
+
+@dataclass
+class Prediction:
+    """
+    Predicted packet latency and average hops with their standard
+    deviations. Log latency std is the relative uncertainty of the
+    latency, infinite when the surrogate cannot tell.
+    """
+    latency: float
+    latency_std: float
+    hops: float
+    hops_std: float
+    log_latency_std: float
+
+
+class Surrogate:
+    """
+    Bayesian ridge regression of log packet latency and average hops
+    on topology size, degree, average distance, injection rate, channel
+    load, routing function and traffic. Weights have a closed form,
+    standard deviations of predictions come from their posterior and
+    the residual noise, so they grow away from the training data.
+    Configs with routing or traffic not seen in training, or differing
+    in a feature constant in training, e.g. a size never simulated,
+    are unknown, as are all configs before there are enough results.
+    """
+    _UNKNOWN = Prediction(math.nan, math.inf, math.nan, math.inf, math.inf)
+
+    def __init__(self, alpha: float = 1.0):
+        self._alpha = alpha
+        self._routing: list[str] = []
+        self._traffic: list[str] = []
+        self._fitted = False
+        self.num_samples = 0
+
+    def _onehot(self, routing: str, traffic: str) -> list[float]:
+        return ([float(routing == r) for r in self._routing]
+                + [float(traffic == t) for t in self._traffic])
+
+    def fit(self, rows: Iterable[dict]) -> None:
+        """
+        Fits the model to training rows of load_results.
+        """
+        samples = []
+        for d in rows:
+            base = _features(d)
+            latency = d["packet_latency_avg"]
+            if base is None or not latency > 0:
+                continue
+            samples.append((base, d["cfg_routing_func"],
+                            d["cfg_traffic_type"], math.log(latency),
+                            d["hops_avg"]))
+        self._routing = sorted({s[1] for s in samples})
+        self._traffic = sorted({s[2] for s in samples})
+        self.num_samples = len(samples)
+        self._fitted = False
+        if not samples:
+            return
+        x = np.array([base + self._onehot(routing, traffic)
+                      for base, routing, traffic, _, _ in samples])
+        y = np.array([s[3:] for s in samples])
+        n, p = x.shape
+        if n <= p:
+            logger.info(f"Surrogate has only {n} results for {p} "
+                        "features, all configs are unknown.")
+            return
+
+        self._mean = x.mean(axis=0)
+        self._scale = x.std(axis=0)
+        self._constant = self._scale <= 1e-9 * np.maximum(
+            np.abs(self._mean), 1.0)
+        self._scale[self._constant] = 1.0
+        z = (x - self._mean) / self._scale
+        self._y_mean = y.mean(axis=0)
+        self._a_inv = np.linalg.inv(z.T @ z + self._alpha * np.eye(p))
+        self._weights = self._a_inv @ z.T @ (y - self._y_mean)
+        residuals = y - self._y_mean - z @ self._weights
+        self._noise_var = (residuals ** 2).sum(axis=0) / (n - p)
+        self._fitted = True
+        noise = np.sqrt(self._noise_var)
+        logger.info(f"Surrogate fit on {n} results, residual std of "
+                    f"log latency {noise[0]:.3f}, of hops {noise[1]:.3f}.")
+
+    def predict(self, cfg: Config) -> Prediction:
+        d = cfg.to_dict()
+        base = _features(d) if self._fitted else None
+        if (base is None or cfg.routing_function not in self._routing
+                or cfg.traffic_type not in self._traffic):
+            return self._UNKNOWN
+        z = (np.array(base + self._onehot(cfg.routing_function,
+                                          cfg.traffic_type))
+             - self._mean) / self._scale
+        if np.any(np.abs(z[self._constant]) > 1e-9):
+            return self._UNKNOWN
+        mean = self._y_mean + z @ self._weights
+        std = np.sqrt(self._noise_var * (
+            1 + 1 / self.num_samples + z @ self._a_inv @ z))
+        latency = math.exp(mean[0])
+        return Prediction(latency, latency * float(std[0]), float(mean[1]),
+                          float(std[1]), float(std[0]))
+
+
+class SurrogateFilter:
+    """
+    Lets through configs worth simulating: those the surrogate is
+    unsure about, with relative latency uncertainty above
+    `max_uncertainty`, and those predicted competitive, whose latency
+    one standard deviation below the prediction is within `slack` of
+    the best latency of their group. A group is configs differing only
+    in topology links. Configs are generated topology by topology, so
+    a group spans the whole sweep. Every config is decided as it
+    arrives, against the best latency of its group observed in
+    training or predicted so far, and only that best is kept. Early
+    configs of a group are judged against a partial best, which errs
+    towards simulating them. With `predictions_file`, predictions of
+    all candidates are written to it as CSV.
+    """
+    _PREDICTION_COLUMNS = ["predicted_latency", "latency_std",
+                           "predicted_hops", "hops_std", "simulated"]
+
+    def __init__(self, surrogate: Surrogate, observed: dict[tuple, float],
+                 max_uncertainty: float = 0.1, slack: float = 0.05,
+                 predictions_file: Path | None = None):
+        self.surrogate = surrogate
+        self.max_uncertainty = max_uncertainty
+        self.slack = slack
+        # Lowest observed or predicted latency of every group.
+        self._best = dict(observed)
+        self._file = None
+        self._writer = None
+        if predictions_file is not None:
+            self._file = open(predictions_file, "w", newline="")
+            self._writer = csv.writer(self._file)
+
+    @classmethod
+    def from_results(cls, file: Path, max_uncertainty: float = 0.1,
+                     slack: float = 0.05,
+                     predictions_file: Path | None = None
+                     ) -> "SurrogateFilter":
+        """
+        Trains the surrogate on a result store.
+        """
+        rows = load_results(file)
+        surrogate = Surrogate()
+        surrogate.fit(rows)
+        observed: dict[tuple, float] = {}
+        for d in rows:
+            key = _group(d)
+            observed[key] = min(observed.get(key, math.inf),
+                                d["packet_latency_avg"])
+        return cls(surrogate, observed, max_uncertainty, slack,
+                   predictions_file)
+
+    def _worth_simulating(self, p: Prediction, best: float) -> bool:
+        if p.log_latency_std > self.max_uncertainty:
+            return True
+        optimistic = p.latency * math.exp(-p.log_latency_std)
+        return optimistic <= best * (1 + self.slack)
+
+    def _write(self, cfg_dict: dict, p: Prediction, simulate: bool) -> None:
+        if self._writer is None:
+            return
+        if self._file.tell() == 0:
+            self._writer.writerow(
+                list(cfg_dict) + self._PREDICTION_COLUMNS)
+        self._writer.writerow(list(cfg_dict.values()) + [
+            p.latency, p.latency_std, p.hops, p.hops_std, simulate])
+
+    def select(self, configs: Iterator[Config],
+               on_reject: Callable[[Config], None]) -> Iterator[Config]:
+        """
+        Returns configs worth simulating, lazily.
+        """
+        total = skipped = 0
+        for cfg in configs:
+            total += 1
+            cfg_dict = cfg.to_dict()
+            key = _group(cfg_dict)
+            p = self.surrogate.predict(cfg)
+            if math.isfinite(p.log_latency_std):
+                self._best[key] = min(self._best.get(key, math.inf),
+                                      p.latency)
+            simulate = self._worth_simulating(
+                p, self._best.get(key, math.inf))
+            self._write(cfg_dict, p, simulate)
+            if simulate:
+                yield cfg
+            else:
+                skipped += 1
+                on_reject(cfg)
+        logger.info(f"Surrogate skipped {skipped} of {total} "
+                    "configs as certain and not competitive.")
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
@@ -0,0 +1,103 @@
+from functools import lru_cache
+from dataclasses import dataclass
+from collections.abc import Iterator, Callable
+from loguru import logger
+from model import Config, Topology
+from circulant_builder import Circulant, GraphMetrics
+
+
+@lru_cache(maxsize=4096)
+def _circulant_metrics(num_nodes: int, links: str) -> GraphMetrics:
+    return Circulant(
+        num_nodes, list(map(int, links.split(",")))).distance_metrics()
+
+
+def topology_metrics(topo: Topology) -> GraphMetrics | None:
+    """
+    Returns distance metrics of circulant topologies, None for other
+    topologies and invalid circulants.
+    """
+    if topo.name != "circulant":
+        return None
+    try:
+        return _circulant_metrics(topo.num_nodes, topo.links)
+    except ValueError:
+        return None
+
+
+@dataclass
+class TopologyFilter:
+    """
+    Decides which circulant candidates reach the simulator by their
+    distance metrics. Disconnected circulants are always rejected,
+    with top_k only the k topologies with the lowest average distance
+    among those of the same size are kept. Other topologies pass.
+    """
+    max_diameter: float | None = None
+    max_avg_distance: float | None = None
+    top_k: int | None = None
+
+    def admits(self, metrics: GraphMetrics | None) -> bool:
+        if metrics is None:
+            return True
+        if not metrics.connected:
+            return False
+        if (self.max_diameter is not None
+                and metrics.diameter > self.max_diameter):
+            return False
+        if (self.max_avg_distance is not None
+                and metrics.avg_distance > self.max_avg_distance):
+            return False
+        return True
+
+    def _best_topologies(self, configs: list[Config]) -> set[tuple]:
+        by_size: dict[int, set[tuple]] = {}
+        for cfg in configs:
+            if topology_metrics(cfg.topo) is not None:
+                by_size.setdefault(cfg.topo.num_nodes, set()).add(
+                    (cfg.topo.num_nodes, cfg.topo.links))
+        best: set[tuple] = set()
+        for topos in by_size.values():
+            ranked = sorted(topos, key=lambda t: (
+                _circulant_metrics(*t).avg_distance,
+                _circulant_metrics(*t).diameter,
+                t[1],
+            ))
+            best.update(ranked[:self.top_k])
+        return best
+
+    def _admitted(self, configs: Iterator[Config],
+                  on_reject: Callable[[Config], None]) -> Iterator[Config]:
+        rejected = 0
+        for cfg in configs:
+            if self.admits(topology_metrics(cfg.topo)):
+                yield cfg
+            else:
+                rejected += 1
+                on_reject(cfg)
+        logger.info(f"Topology filter rejected {rejected} configs "
+                    "by metric thresholds.")
+
+    def _top_k(self, configs: list[Config],
+               on_reject: Callable[[Config], None]) -> Iterator[Config]:
+        best = self._best_topologies(configs)
+        rejected = 0
+        for cfg in configs:
+            if (topology_metrics(cfg.topo) is None
+                    or (cfg.topo.num_nodes, cfg.topo.links) in best):
+                yield cfg
+            else:
+                rejected += 1
+                on_reject(cfg)
+        logger.info(f"Topology filter rejected {rejected} configs "
+                    f"out of top {self.top_k}.")
+
+    def select(self, configs: Iterator[Config],
+               on_reject: Callable[[Config], None]) -> Iterator[Config]:
+        """
+        Returns admitted configs, lazily unless top_k is set.
+        """
+        configs = self._admitted(configs, on_reject)
+        if self.top_k is not None:
+            configs = self._top_k(list(configs), on_reject)
+        return configs
@@ -0,0 +1,84 @@
+import heapq
+from threading import Lock
+from itertools import count
+from loguru import logger
+from model import Config, Result
+
+
+class UsageReport:
+    """
+    Collects resource usage of the simulations of a sweep and logs
+    totals and the `top` most expensive configs by CPU time and by
+    peak RSS. Only the top configs are kept in memory.
+    Thread-safe.
+    """
+    def __init__(self, top: int = 10):
+        self._top = top
+        self._mx = Lock()
+        self._runs = 0
+        self._wall_time = 0.0
+        self._cpu_time = 0.0
+        self._config_time = 0.0
+        self._parse_time = 0.0
+        # Min-heaps of (cost, tie breaker, config, wall time).
+        self._by_cpu: list[tuple[float, int, Config, float]] = []
+        self._by_rss: list[tuple[int, int, Config, float]] = []
+        self._order = count()
+
+    @staticmethod
+    def _cpu(res: Result) -> float:
+        """
+        CPU time of the run, wall time when it was not measured.
+        """
+        if res.cpu_user_time is None:
+            return res.wall_time
+        return res.cpu_user_time + res.cpu_sys_time
+
+    def _push(self, heap: list, cost: float, res: Result) -> None:
+        item = (cost, next(self._order), res.config, res.wall_time)
+        if len(heap) < self._top:
+            heapq.heappush(heap, item)
+        else:
+            heapq.heappushpop(heap, item)
+
+    def add(self, res: Result) -> None:
+        """
+        Adds a simulated result, results without usage are skipped.
+        """
+        if res.wall_time is None:
+            return
+        with self._mx:
+            self._runs += 1
+            self._wall_time += res.wall_time
+            self._cpu_time += self._cpu(res)
+            self._config_time += res.config_time or 0.0
+            self._parse_time += res.parse_time or 0.0
+            self._push(self._by_cpu, self._cpu(res), res)
+            if res.peak_rss_kb is not None:
+                self._push(self._by_rss, res.peak_rss_kb, res)
+
+    @staticmethod
+    def _describe(cfg: Config) -> str:
+        return (f"{cfg.topo.name}_N{cfg.topo.num_nodes}_L{cfg.topo.links} "
+                f"{cfg.routing_function} {cfg.traffic_type} "
+                f"rate {cfg.injection_rate} x{cfg.sim_count}")
+
+    def log(self) -> None:
+        with self._mx:
+            if not self._runs:
+                return
+            logger.info(
+                f"Resource usage of {self._runs} simulations: "
+                f"{self._wall_time:.1f} s wall, {self._cpu_time:.1f} s CPU, "
+                f"{self._config_time:.2f} s config generation, "
+                f"{self._parse_time:.2f} s output parsing.")
+            lines = ["Most expensive configs by CPU time:"]
+            for cpu, _, cfg, wall in sorted(self._by_cpu, reverse=True):
+                lines.append(f"  {cpu:9.2f} s CPU {wall:9.2f} s wall  "
+                             f"{self._describe(cfg)}")
+            if self._by_rss:
+                lines.append("Most expensive configs by peak RSS:")
+                for rss, _, cfg, _ in sorted(self._by_rss, reverse=True):
+                    lines.append(f"  {rss / 1024:9.1f} MiB  "
+                                 f"{self._describe(cfg)}")
+            logger.info("\n".join(lines))
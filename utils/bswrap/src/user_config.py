@@ -1,4 +1,5 @@
 from runner import SimulationTask
+from sim_output import AbortRule, LatencyGrowthRule, AcceptanceRule
 
 
 TASK_CONFIG = [
@@ -9,5 +10,10 @@ TASK_CONFIG = [
         routing_funcs=[],
         traffic_types=[],
         sim_counts=[],
+        injection_rates=[0.0001],
     )
 ]
+
+# Rules aborting simulations that are clearly past saturation, e.g.
+# [LatencyGrowthRule(periods=3, min_growth=0.05), AcceptanceRule(0.9)]
+ABORT_RULES: list[AbortRule] = []